@@ -0,0 +1,71 @@
+"""
+bench_import.py - time how long it takes a fresh interpreter to import lc
+
+Scoring jobs are short-lived, so the time to import lc (and with it treepredict,
+forest and boost) is paid on every run. Each import is timed in a new interpreter
+so nothing is already loaded, and the run fails if the median goes over the budget
+or if a heavy module that should only load on use (numpy, PIL) was imported.
+
+USAGE:
+
+    python bench_import.py [runs] [budget in ms]
+
+"""
+import os
+import subprocess
+import sys
+
+MODULES = ('lc', 'treepredict')
+HEAVY = ('numpy', 'PIL')
+
+TIMER = '''
+import sys, time
+start = time.time()
+import %s
+print (time.time() - start) * 1000.0
+print ' '.join([m for m in %r if m in sys.modules])
+'''
+
+
+def time_import(module):
+    '''
+    Import module in a new interpreter, returning the milliseconds it took and the
+    heavy modules that came with it
+    '''
+    here = os.path.dirname(os.path.abspath(__file__))
+    output = subprocess.Popen([sys.executable, '-c', TIMER % (module, HEAVY)],
+        cwd=here, stdout=subprocess.PIPE).communicate()[0]
+    lines = output.splitlines()
+    return float(lines[0]), lines[1].split() if len(lines) > 1 else []
+
+
+def main(runs=20, budget=100.0):
+    '''
+    Time runs imports of each module and report the best and median times
+    '''
+    failed = False
+    for module in MODULES:
+        # the first import compiles the .pyc, which isn't what we're measuring
+        time_import(module)
+        times = []
+        loaded = set()
+        for i in range(runs):
+            ms, heavy = time_import(module)
+            times.append(ms)
+            loaded.update(heavy)
+        times.sort()
+        median = times[len(times) / 2]
+        print "import %s: best %.1f ms, median %.1f ms over %d runs" % (module, times[0], median, runs)
+        if median > budget:
+            print "  over the budget of %.1f ms" % budget
+            failed = True
+        if loaded:
+            print "  also imported %s" % ', '.join(sorted(loaded))
+            failed = True
+    return failed
+
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    budget = float(sys.argv[2]) if len(sys.argv) > 2 else 100.0
+    sys.exit(main(runs, budget) and 1 or 0)
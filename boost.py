@@ -0,0 +1,220 @@
+import treepredict
+from treepredict import decisionnode,numpy
+
+# Gradient-boosted trees for a two-valued result: a sum of small
+# regression trees, each fitted to the gradients of the log loss
+# of the ones before it. The trees are ordinary decisionnode trees
+# (compiled) whose leaves hold a number, the amount they add to
+# the log odds of the positive result, in place of result counts.
+class boostedtrees:
+  def __init__(self,base,trees,labels,positive):
+    self.base=base
+    self.trees=trees
+    self.labels=labels
+    self.positive=positive
+
+  def __len__(self):
+    return len(self.trees)
+
+  # The log odds of the positive result for one observation
+  def decision(self,observation):
+    return self.base+sum([tree.classify(observation) for tree in self.trees])
+
+  def classify(self,observation):
+    return _probabilities(self.labels,self.positive,_sigmoid(self.decision(observation)))
+
+  # The log odds for every row of a columnset, one tree at a time
+  def decision_batch(self,matrix):
+    scores=numpy.zeros(len(matrix))+self.base
+    for tree in self.trees:
+      scores+=_leafvalues(tree)[treepredict.route_batch(matrix,tree)]
+    return scores
+
+  # An array with a row for each row of matrix and a column for
+  # each of the labels, like treepredict.classify_batch
+  def classify_batch(self,matrix):
+    p=_sigmoid(self.decision_batch(matrix))
+    probabilities=numpy.zeros((len(matrix),len(self.labels)))
+    for i,l in enumerate(self.labels):
+      if l==self.positive: probabilities[:,i]=p
+      else: probabilities[:,i]=1-p
+    return probabilities
+
+def _sigmoid(f):
+  if numpy is not None: return 1/(1+numpy.exp(-f))
+  from math import exp
+  return 1/(1+exp(-f))
+
+def _probabilities(labels,positive,p):
+  result={}
+  for l in labels:
+    if l==positive: result[l]=p
+    else: result[l]=1-p
+  return result
+
+def _leafvalues(tree):
+  return numpy.array([r or 0.0 for r in tree.results])
+
+# The log loss of scores (log odds) against y (1 for positive)
+def _logloss(scores,y):
+  return numpy.mean(numpy.logaddexp(0,scores)-y*scores)
+
+# Bin the numeric rows of every column of a columnset on at most
+# maxbins edges taken from its values, so that each node finds
+# its best threshold from a histogram of gradient sums rather than
+# by sorting. Returns (edges,bins) for each column, where bins[i]
+# is the number of the highest edge at or below row i's value, or
+# len(edges) for rows that aren't numbers (they never pass a
+# threshold). Columns without numbers get (None,None).
+def _gradientbins(data,maxbins):
+  result=[]
+  for col in range(0,len(data.values)):
+    values,codes=data.values[col],data.codes[col]
+    if values is None:
+      result.append((None,None))
+      continue
+    if codes is None: numeric=numpy.ones(len(values),dtype=bool)
+    else: numeric=codes<0
+    found=numpy.sort(values[numeric])
+    edges=numpy.unique(found)
+    if len(edges)>maxbins:
+      edges=numpy.unique(found[(numpy.arange(maxbins)*len(found))//maxbins])
+    bins=numpy.zeros(len(values),dtype=numpy.intp)+len(edges)
+    bins[numeric]=numpy.searchsorted(edges,values[numeric],'right')-1
+    result.append((edges,bins))
+  return result
+
+# The best split of the rows in index, scored by how much it
+# lowers the second-order estimate of the loss, sum(G*G/(H+l)),
+# worked out from running sums of the gradients (g) and hessians
+# (h) over the bins of each column. Returns (gain,col,value).
+def _bestgradientsplit(data,bins,index,g,h,regularization,minleaf):
+  gi,hi=g[index],h[index]
+  G,H,n=gi.sum(),hi.sum(),len(index)
+  current=G*G/(H+regularization)
+  best_gain,best_col,best_value=0.0,None,None
+
+  def gains(gt,ht,nt):
+    gf,hf,nf=G-gt,H-ht,n-nt
+    gain=gt*gt/(ht+regularization)+gf*gf/(hf+regularization)-current
+    gain[(nt<minleaf)|(nf<minleaf)]=-1
+    return gain
+
+  for col in range(0,len(data.values)):
+    edges,codes=bins[col]
+    if edges is not None:
+      k=len(edges)
+      b=codes[index]
+      # Sums over the rows at or above each edge
+      gt=numpy.cumsum(numpy.bincount(b,weights=gi,minlength=k+1)[k-1::-1])[::-1]
+      ht=numpy.cumsum(numpy.bincount(b,weights=hi,minlength=k+1)[k-1::-1])[::-1]
+      nt=numpy.cumsum(numpy.bincount(b,minlength=k+1)[k-1::-1])[::-1]
+      gain=gains(gt,ht,nt)
+      i=gain.argmax()
+      if gain[i]>best_gain:
+        best_gain,best_col=gain[i],col
+        best_value=data.splitvalue(col,edges[i],True)
+
+    codes=data.codes[col]
+    if codes is not None:
+      k=len(data.categories[col])
+      c=codes[index]
+      named=c>=0
+      gt=numpy.bincount(c[named],weights=gi[named],minlength=k)
+      ht=numpy.bincount(c[named],weights=hi[named],minlength=k)
+      nt=numpy.bincount(c[named],minlength=k)
+      gain=gains(gt,ht,nt)
+      # Numbers pass an equality test with None, so it doesn't
+      # split the way the sums say
+      if None in data.categories[col]: gain[data.categories[col].index(None)]=-1
+      i=gain.argmax()
+      if gain[i]>best_gain:
+        best_gain,best_col,best_value=gain[i],col,data.categories[col][i]
+  return (best_gain,best_col,best_value)
+
+# Grow one regression tree on the rows in index. Its leaves hold
+# the Newton step -G/(H+l) for their rows, scaled by shrinkage.
+def _buildregressiontree(data,bins,index,g,h,maxdepth,minleaf,mingain,
+                         regularization,shrinkage):
+  def leaf(index):
+    return decisionnode(results=float(-shrinkage*g[index].sum()/(h[index].sum()+regularization)))
+
+  tree=decisionnode()
+  stack=[(tree,index,0)]
+  while len(stack)>0:
+    node,index,depth=stack.pop()
+    gain,col=0.0,None
+    if depth<maxdepth and len(index)>=2*minleaf:
+      gain,col,value=_bestgradientsplit(data,bins,index,g,h,regularization,minleaf)
+    if col==None or gain<=mingain:
+      node.results=leaf(index).results
+      continue
+    mask=treepredict._batchmask(data,col,value,index)
+    node.col,node.value=col,value
+    node.tb,node.fb=decisionnode(),decisionnode()
+    stack.append((node.fb,index[~mask],depth+1))
+    stack.append((node.tb,index[mask],depth+1))
+  return tree
+
+# Fit up to rounds trees of at most maxdepth levels to rows (a
+# columnset or a list of rows) with a two-valued result, boosting
+# the log odds of positive. Each tree is fitted to a random
+# subsample of the rows and shrunk by shrinkage. validation is a
+# columnset to watch, or the fraction of rows to hold out for it;
+# once the loss on it hasn't improved for patience rounds the
+# trees after the best round are dropped. Thresholds are picked
+# from at most maxbins values of each column.
+def buildboost(rows,rounds=100,shrinkage=0.1,maxdepth=3,subsample=0.8,
+               validation=0.1,patience=10,positive='BAD',maxbins=255,
+               minleaf=20,mingain=0.0,regularization=1.0,seed=None):
+  if numpy==None: raise ImportError('buildboost needs numpy')
+  if isinstance(rows,treepredict.columnset): data=rows
+  else: data=treepredict.columnset.fromrows(rows)
+  if len(data.labels)>2:
+    raise ValueError('buildboost needs two results, found %d' % len(data.labels))
+  if positive not in data.labels:
+    raise ValueError('%r is not one of the results' % (positive,))
+  rng=numpy.random.RandomState(seed)
+
+  watch=None
+  if isinstance(validation,treepredict.columnset):
+    watch=validation
+  elif validation:
+    order=rng.permutation(len(data))
+    held=int(validation*len(data))
+    watch=data.subset(numpy.sort(order[:held]))
+    data=data.subset(numpy.sort(order[held:]))
+
+  positivecode=data.labels.index(positive)
+  y=(data.y==positivecode).astype(float)
+  rate=min(max(y.mean(),1e-6),1-1e-6)
+  base=numpy.log(rate/(1-rate))
+  scores=numpy.zeros(len(data))+base
+  bins=_gradientbins(data,maxbins)
+  if watch is not None:
+    watchy=numpy.array([watch.labels[c]==positive for c in watch.y],dtype=float)
+    watchscores=numpy.zeros(len(watch))+base
+    best_loss,best_round=_logloss(watchscores,watchy),0
+
+  trees=[]
+  samplesize=max(1,int(subsample*len(data)))
+  for i in range(0,rounds):
+    p=_sigmoid(scores)
+    g=p-y
+    h=numpy.maximum(p*(1-p),1e-16)
+    if samplesize<len(data): index=numpy.sort(rng.choice(len(data),samplesize,replace=False))
+    else: index=numpy.arange(len(data))
+    tree=treepredict.compile_tree(_buildregressiontree(
+      data,bins,index,g,h,maxdepth,minleaf,mingain,regularization,shrinkage))
+    trees.append(tree)
+
+    # Move every row's score on by its leaf in one pass
+    scores+=_leafvalues(tree)[treepredict.route_batch(data,tree)]
+    if watch is None: continue
+    watchscores+=_leafvalues(tree)[treepredict.route_batch(watch,tree)]
+    loss=_logloss(watchscores,watchy)
+    if loss<best_loss: best_loss,best_round=loss,len(trees)
+    elif len(trees)-best_round>=patience: break
+
+  if watch is not None: trees=trees[:best_round]
+  return boostedtrees(float(base),trees,data.labels,positive)
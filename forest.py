@@ -0,0 +1,87 @@
+from math import sqrt
+import random
+import treepredict
+
+# A random forest: a list of compiled trees, each grown from a
+# bootstrap sample of the rows with only a few random columns
+# tried at every split. Its answers are the averages of the
+# trees' leaf distributions.
+class randomforest:
+  def __init__(self,trees):
+    self.trees=trees
+    found={}
+    for tree in trees:
+      for label in tree.labels: found[label]=1
+    self.labels=sorted(found.keys())
+
+  def __len__(self):
+    return len(self.trees)
+
+  # The average over the trees of the fraction of each result in
+  # the leaf the observation lands in
+  def classify(self,observation):
+    result={}
+    for tree in self.trees:
+      leaf=tree.classify(observation)
+      if not leaf: continue
+      total=float(sum(leaf.values()))
+      for k,c in leaf.items():
+        result[k]=result.get(k,0)+c/total/len(self.trees)
+    return result
+
+  # The same for every row of a columnset at once, as an array with
+  # a column for each of the forest's labels
+  def classify_batch(self,matrix):
+    numpy=treepredict.numpy
+    labelindex=dict([(l,i) for i,l in enumerate(self.labels)])
+    probabilities=numpy.zeros((len(matrix),len(self.labels)))
+    for tree in self.trees:
+      columns=[labelindex[l] for l in tree.labels]
+      probabilities[:,columns]+=treepredict.classify_batch(matrix,tree)
+    return probabilities/len(self.trees)
+
+def _columncount(rows):
+  if isinstance(rows,treepredict.columnset): return len(rows.values)
+  if isinstance(rows,treepredict.binnedset): return len(rows.columns)
+  return len(rows[0])-1
+
+# Grow one tree from a bootstrap sample drawn with the given seed
+def _buildone(rows,seed,samplesize,options):
+  rng=random.Random(seed)
+  n=len(rows)
+  sample=[rng.randrange(n) for i in xrange(samplesize or n)]
+  tree=treepredict.buildtree(rows,sample=sample,rng=rng,**options)
+  return treepredict.compile_tree(tree)
+
+# A pool's workers are started with the rows by
+# treepredict._initpool, so a task is just a seed and the options
+def _buildforesttree(task):
+  seed,samplesize,options=task
+  return _buildone(treepredict._poolrows,seed,samplesize,options)
+
+# Build a forest of ntrees trees from rows (a list of rows, a
+# columnset or a binnedset). Each tree gets a bootstrap sample of
+# samplesize rows (all of them by default) and tries maxfeatures
+# random columns at each split (the square root of the number of
+# columns by default). Other options, like scoref, maxdepth or
+# maxbins, are passed on to treepredict.buildtree. With workers the
+# trees are built at the same time in a process pool.
+def buildforest(rows,ntrees=100,maxfeatures=None,samplesize=None,workers=None,
+                seed=None,**options):
+  if options.get('maxbins')!=None and not isinstance(rows,treepredict.binnedset):
+    # Bin once here rather than once per tree
+    rows=treepredict.binrows(rows,options.pop('maxbins'))
+  if maxfeatures==None: maxfeatures=max(1,int(sqrt(_columncount(rows))))
+  options['maxfeatures']=maxfeatures
+
+  rng=random.Random(seed)
+  tasks=[(rng.random(),samplesize,options) for i in range(0,ntrees)]
+  if not workers:
+    return randomforest([_buildone(rows,*task) for task in tasks])
+
+  from multiprocessing import Pool
+  pool=Pool(workers,treepredict._initpool,(rows,))
+  try:
+    return randomforest(pool.map(_buildforesttree,tasks))
+  finally:
+    pool.terminate()
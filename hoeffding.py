@@ -0,0 +1,212 @@
+from math import erf,log,sqrt
+import treepredict
+from treepredict import decisionnode,entropyofcounts
+
+# A decision tree learned from a stream of rows, one at a time
+# (a Hoeffding tree, or VFDT). Every leaf keeps counts of the
+# results it has seen and, for each column, enough to estimate
+# how any split of its rows would go. Once a leaf has seen enough
+# rows that the Hoeffding bound says its best split really is
+# better than the next best column's, it splits. Nothing is kept
+# of the rows themselves, so memory depends on the number of
+# leaves (at most maxleaves) and not on the length of the stream.
+class hoeffdingtree:
+  def __init__(self,delta=1e-7,graceperiod=200,tiethreshold=0.05,
+               maxleaves=1000,maxcategories=100,thresholds=10):
+    self.delta=delta
+    self.graceperiod=graceperiod
+    self.tiethreshold=tiethreshold
+    self.maxleaves=maxleaves
+    self.maxcategories=maxcategories
+    self.thresholds=thresholds
+    self.root=_newleaf({})
+    self.leaves=1
+    self.seen=0
+
+  # Learn from one row (the last column is the result)
+  def add(self,row):
+    self.seen+=1
+    node=_findleaf(row,self.root)
+    stats=node.stats
+    result=row[len(row)-1]
+    stats.counts[result]=stats.counts.get(result,0)+1
+    stats.n+=1
+    if self.leaves>=self.maxleaves:
+      # No more splits, so the column statistics aren't needed
+      stats.nominal=stats.numeric=None
+      return
+    stats.observe(row,result,self.maxcategories)
+    if stats.n-stats.lastcheck>=self.graceperiod:
+      stats.lastcheck=stats.n
+      self.trysplit(node)
+
+  def update(self,rows):
+    for row in rows: self.add(row)
+    return self
+
+  # Split the leaf if its best split wins by more than the
+  # Hoeffding bound, or the bound is so small the choice between
+  # the best two doesn't matter
+  def trysplit(self,node):
+    stats=node.stats
+    if len(stats.observed)<2: return
+    candidates=stats.bestsplits(self.thresholds)
+    if len(candidates)==0: return
+    candidates.sort(reverse=True)
+    best=candidates[0]
+    second=0.0
+    if len(candidates)>1: second=candidates[1][0]
+    spread=log(len(stats.observed),2)
+    bound=sqrt(spread*spread*log(1/self.delta)/(2.0*stats.n))
+    if best[0]<=0 or (best[0]-second<=bound and bound>=self.tiethreshold): return
+    gain,col,value,tbcounts,fbcounts=best
+    node.col,node.value=col,value
+    node.tb,node.fb=_newleaf(tbcounts),_newleaf(fbcounts)
+    node.stats=None
+    self.leaves+=1
+
+  def classify(self,observation):
+    return _results(_findleaf(observation,self.root).stats.counts)
+
+  # A copy of the tree made of plain decisionnodes, with each
+  # leaf's result counts rounded to whole rows
+  def totree(self):
+    tree=decisionnode()
+    stack=[(self.root,tree,{})]
+    while len(stack)>0:
+      node,copy,parent=stack.pop()
+      if node.stats!=None:
+        copy.results=_results(node.stats.counts) or parent
+        continue
+      copy.col,copy.value=node.col,node.value
+      copy.tb,copy.fb=decisionnode(),decisionnode()
+      counts=_results(_subtreecounts(node))
+      stack.append((node.fb,copy.fb,counts))
+      stack.append((node.tb,copy.tb,counts))
+    return treepredict.cachecounts(tree)
+
+# What a leaf knows about the rows that have reached it: counts of
+# their results, and for each column the result counts for each
+# category seen (up to maxcategories of them) and, for numbers, a
+# running count, mean, variance, minimum and maximum per result.
+# counts starts out with the leaf's share of its parent's rows, for
+# classify; splits are only scored from the rows observed since the
+# leaf was made, which observed counts, as the column statistics
+# only cover those.
+class _leafstats:
+  def __init__(self,counts):
+    self.counts=dict(counts)
+    self.observed={}
+    self.n=0
+    self.lastcheck=0
+    self.nominal=None
+    self.numeric=None
+
+  def observe(self,row,result,maxcategories):
+    columns=len(row)-1
+    self.observed[result]=self.observed.get(result,0)+1
+    if self.nominal==None:
+      self.nominal=[{} for col in range(0,columns)]
+      self.numeric=[{} for col in range(0,columns)]
+    for col in range(0,columns):
+      v=row[col]
+      if isinstance(v,int) or isinstance(v,float):
+        s=self.numeric[col].get(result)
+        if s==None:
+          self.numeric[col][result]=[1,float(v),0.0,v,v]
+          continue
+        # Welford's running mean and sum of squares
+        s[0]+=1
+        d=v-s[1]
+        s[1]+=d/s[0]
+        s[2]+=d*(v-s[1])
+        if v<s[3]: s[3]=v
+        if v>s[4]: s[4]=v
+      else:
+        categories=self.nominal[col]
+        if v not in categories:
+          if len(categories)>=maxcategories: continue
+          categories[v]={}
+        categories[v][result]=categories[v].get(result,0)+1
+
+  # The best split on each column as (gain,col,value,tbcounts,
+  # fbcounts). A row whose value isn't the kind a split tests for
+  # goes down the false branch, as it would in classify.
+  def bestsplits(self,thresholds):
+    if self.nominal==None: return []
+    total=sum(self.observed.values())
+    current=entropyofcounts(self.observed.values(),total)
+
+    def gain(tbcounts):
+      fbcounts=dict([(r,max(0.0,c-tbcounts.get(r,0))) for r,c in self.observed.items()])
+      nt=sum(tbcounts.values())
+      nf=sum(fbcounts.values())
+      if nt<=0 or nf<=0: return -1,fbcounts
+      g=current-(nt*entropyofcounts(tbcounts.values(),nt)+
+                 nf*entropyofcounts(fbcounts.values(),nf))/total
+      return g,fbcounts
+
+    splits=[]
+    for col in range(0,len(self.nominal)):
+      best=None
+      for value,tbcounts in self.nominal[col].items():
+        g,fbcounts=gain(tbcounts)
+        if best==None or g>best[0]: best=(g,col,value,dict(tbcounts),fbcounts)
+      found=self.numeric[col]
+      if len(found)>0:
+        low=min([s[3] for s in found.values()])
+        high=max([s[4] for s in found.values()])
+        for i in range(1,thresholds+1):
+          value=low+(high-low)*i/float(thresholds+1)
+          tbcounts=dict([(r,_countabove(s,value)) for r,s in found.items()])
+          g,fbcounts=gain(tbcounts)
+          if best==None or g>best[0]: best=(g,col,value,tbcounts,fbcounts)
+      if best!=None and best[0]>0: splits.append(best)
+    return splits
+
+def _newleaf(counts):
+  node=decisionnode()
+  node.stats=_leafstats(counts)
+  return node
+
+# The estimated number of rows summarized by s that are >= value,
+# taking them to be normally distributed between their min and max
+def _countabove(s,value):
+  n,mean,m2,low,high=s
+  if value<=low: return float(n)
+  if value>high: return 0.0
+  sd=sqrt(m2/n)
+  if sd==0: return float(n)*(mean>=value)
+  return n*0.5*(1-erf((value-mean)/(sd*sqrt(2))))
+
+# The leaf an observation reaches, deciding each split the way
+# classify does
+def _findleaf(observation,node):
+  while node.stats==None:
+    v=observation[node.col]
+    if isinstance(v,int) or isinstance(v,float): test=v>=node.value
+    else: test=v==node.value
+    if test: node=node.tb
+    else: node=node.fb
+  return node
+
+def _subtreecounts(node):
+  counts={}
+  stack=[node]
+  while len(stack)>0:
+    node=stack.pop()
+    if node.stats!=None:
+      for r,c in node.stats.counts.items(): counts[r]=counts.get(r,0)+c
+    else:
+      stack.append(node.tb)
+      stack.append(node.fb)
+  return counts
+
+# Result counts as whole numbers, leaving out the ones that round
+# to nothing
+def _results(counts):
+  results={}
+  for r,c in counts.items():
+    c=int(round(c))
+    if c>0: results[r]=c
+  return results
@@ -46,9 +46,13 @@ import csv
 import os
 import sys
 import json
+import hashlib
 import random
 import datetime
 import treepredict
+import forest
+import boost
+import hoeffding
 
 class LC(object):
     '''
@@ -57,74 +61,221 @@ class LC(object):
 
     BAD_STATUS = ('Late (31-120 days)', 'Default', 'Performing Payment Plan', 'Charged Off')
 
+    # columns we don't train or test on
+    DROPPED_COLUMNS = ('Application Date', 'Application Expiration Date', 'Issued Date', 
+        'Remaining Principal Funded by Investors','Payments To Date (Funded by investors)','Remaining Principal ', 
+        ' Payments To Date','Screen Name', 'Code', 'Total Amount Funded', 'Number of Lenders', 'Expiration Date', 'APR', 'Amount Funded',
+        'Amount Funded By Investors', 'Loan Description', 'Loan Title', 'City', 'State', 'Location', 'Education')
 
-    def __init__(self, training_fn='LoanStats.csv', testing_fn='InFundingStats.csv'):
+    # columns divided into bands of 2500
+    BANDED_COLUMNS = ('Amount Requested','Amount Funded By Investors','Total Amount Funded')
+
+
+    # rows are turned back out of a columnset this many at a time
+    CHUNK_SIZE = 10000
+
+    # normalized files are cached here, and the cache is thrown away whenever this
+    # version changes, so bump it with any change to what normalize_data gives
+    CACHE_DIR = '.lc_cache'
+    NORMALIZER_VERSION = 1
+
+    def __init__(self, training_fn='LoanStats.csv', testing_fn='InFundingStats.csv', keep_data=False,
+                 cache_dir=CACHE_DIR, reference_date=None):
         '''
-        Create some of the lists we'll use
+        Create some of the lists we'll use. Unless keep_data is set the files aren't
+        loaded into lists; everything streams through them instead, in constant memory,
+        and the normalized rows come from the cache in cache_dir (None for no cache).
+        Credit Line Age is counted up to reference_date (a date), or to today; pass
+        one to get the same rows whenever the job runs.
         '''
+        self.training_fn = training_fn
+        self.testing_fn = testing_fn
+        self.cache_dir = cache_dir
+        if reference_date is None:
+            reference_date = datetime.date.today()
+        elif isinstance(reference_date, datetime.datetime):
+            reference_date = reference_date.date()
+        self.reference_date = reference_date
         self.training_data = []
         self.testing_data = []
 
-        if training_fn:
-            self.load_training_data(training_fn)
-        if testing_fn:
-            self.load_testing_data(testing_fn)
+        if keep_data:
+            if training_fn:
+                self.load_training_data(training_fn)
+            if testing_fn:
+                self.load_testing_data(testing_fn)
+
+    def training_source(self):
+        '''
+        The training rows: the loaded list if there is one, otherwise a fresh pass
+        over the training file
+        '''
+        if self.training_data:
+            return self.training_data
+        return self.read_training_data(self.training_fn)
+
+    def testing_source(self):
+        '''
+        The testing rows: the loaded list if there is one, otherwise a fresh pass
+        over the testing file
+        '''
+        if self.testing_data:
+            return self.testing_data
+        return self.read_testing_data(self.testing_fn)
+
+    def training_rows(self):
+        '''
+        Yield the normalized training rows one at a time
+        '''
+        if not self.training_data and self.cache_dir and treepredict.numpy:
+            names, columns = self.cached_columns(self.training_fn)
+            for row in columns.rows(self.CHUNK_SIZE):
+                yield row
+            return
+        if self.training_data:
+            rows = self.normalize_rows(self.training_data)
+        else:
+            rows = self.read_rows(self.training_fn)
+        for row in rows:
+            yield row
+
+    def testing_rows(self):
+        '''
+        Yield the normalized testing rows one at a time
+        '''
+        if not self.testing_data and self.cache_dir and treepredict.numpy:
+            names, columns = self.cached_columns(self.testing_fn, testing=True)
+            for row in columns.rows(self.CHUNK_SIZE):
+                yield row
+            return
+        if self.testing_data:
+            rows = self.normalize_rows(self.testing_data)
+        else:
+            rows = self.read_rows(self.testing_fn, testing=True)
+        for row in rows:
+            yield row
+
+    def data_columns(self, testing=False):
+        '''
+        The normalized training (or testing) rows as a treepredict.columnset, without
+        the Status, from the cache if there is one. None if the rows were loaded into
+        lists or there's no numpy; then they have to be scored one at a time.
+        '''
+        if (self.testing_data if testing else self.training_data) or not treepredict.numpy:
+            return None
+        file_name = self.testing_fn if testing else self.training_fn
+        if self.cache_dir:
+            return self.cached_columns(file_name, testing)[1]
+        return self.read_columns(file_name, testing)[1]
 
     def make_training_sample(self, k=.1):
         '''
         Make a sample of size k of the data. This is used in the decision tree.
+        When streaming, each row is kept with probability k.
         '''
+        if not self.training_data:
+            return [row for row in self.training_rows() if random.random() < k]
         return (self.transform_data(random.sample(self.training_data, int(k * len(self.training_data)))))
 
     def transform_data(self, data):
         '''
         Transform a given dataset into something ready for the decision tree
         '''
-        return [self.normalize_data(row) for row in data]
+        return list(self.normalize_rows(data))
+
+    def make_columnset(self, data):
+        '''
+        Transform a given dataset into a columnar treepredict.columnset (needs numpy).
+        Rows are normalized one at a time straight into the columns, so the list of
+        lists from transform_data is never built.
+        '''
+        return treepredict.columnset.fromrows(self.normalize_rows(data))
 
     def make_tree(self, data):
         '''
-        Make a decision tree with the supplied data
+        Make a decision tree with the supplied data. Nominal columns (CREDIT Rating,
+        Home Ownership and the like) can split on a set of their values at once.
         '''
-        return treepredict.buildtree(data)
+        return treepredict.buildtree(data, categorysets=True)
 
-    def test_tree(self, k=.2):
+    def make_forest(self, data, ntrees=100, workers=None):
         '''
-        Conduct a test of decision trees
+        Make a random forest of ntrees decision trees with the supplied data, building
+        the trees in a pool of workers processes if given
         '''
-        # first get a sample to use for training and make a tree from it
+        return forest.buildforest(data, ntrees=ntrees, workers=workers)
+
+    def make_boost(self, data, rounds=100, shrinkage=0.1, maxdepth=3):
+        '''
+        Make gradient-boosted trees predicting BAD loans with the supplied data (needs
+        numpy). A tenth of the data is held out to decide when to stop adding trees.
+        '''
+        return boost.buildboost(data, rounds=rounds, shrinkage=shrinkage, maxdepth=maxdepth)
+
+    def make_streaming_tree(self, data, tree=None):
+        '''
+        Learn a Hoeffding tree from the supplied data one row at a time, or carry on
+        teaching tree with new rows. tree.totree() gives a decisionnode tree.
+        '''
+        if tree is None:
+            tree = hoeffding.hoeffdingtree()
+        return tree.update(self.normalize_rows(data))
+
+    def test_tree(self, k=.2, model_fn=None):
+        '''
+        Conduct a test of decision trees, saving the tree to model_fn if given so it
+        can be run later without retraining
+        '''
+        # first get a sample to use for training and make a tree from it. each row is
+        # picked with probability k; the picks come from a seeded generator so the
+        # testing pass can make the same picks again rather than remembering them
         print "making sample and training tree..."
-        ids = random.sample(range(len(self.training_data)), int(k * len(self.training_data)))
-        sample = []
-        transform_all = []
-        for i, item in enumerate(self.training_data):
-            row = self.normalize_data(item)
-            if i in ids:
-                sample.append(row)
+        seed = random.random()
+        picker = random.Random(seed)
+        columns = self.data_columns()
+        if columns is not None:
+            picked = treepredict.numpy.array([picker.random() < k for i in xrange(len(columns))])
+            sample = list(columns.subset(picked).rows(self.CHUNK_SIZE))
+        else:
+            sample = [row for row in self.training_rows() if picker.random() < k]
+
+        tree = treepredict.compile_tree(self.make_tree(sample))
+        if model_fn:
+            treepredict.save_tree(tree, model_fn)
+
+        # now go through the rest of all, seeing how it does. rows are scored without
+        # their Loan ID, so the tree sees each column one place to the left
+        def scored():
+            if columns is not None:
+                # the columns are scored all in one go
+                rest = columns.subset(~picked)
+                rest = rest.select(range(1, len(rest.values)))
+                labelindex = dict((l, i) for i, l in enumerate(tree.labels))
+                probabilities = treepredict.classify_batch(rest, tree).tolist()
+                for p, c in zip(probabilities, rest.y.tolist()):
+                    status = rest.labels[c]
+                    yield status, status in labelindex and p[labelindex[status]] > 0
             else:
-                transform_all.append(row)
-
-        tree = self.make_tree(sample)
+                picker = random.Random(seed)
+                for item in self.training_rows():
+                    if not picker.random() < k:
+                        yield item[-1], item[-1] in tree.classify(item[1:-1])
 
-        # now go through the rest of all, seeing how it does
-        num_false_positive = num_false_negative = num_right = 0
+        num_false_positive = num_false_negative = num_right = num_processed = 0
 
         print "testing..."
-        for item in transform_all:
-            status = item[-1]
-            guess = treepredict.classify(item[1:-1], tree)
-
+        for status, right in scored():
             # if we're right, record. if not, determine if false negative (ok) or false positive (bad)
-            if status in guess:
+            if right:
                 num_right += 1
             else:
                 if status == 'GOOD':
                     num_false_negative += 1
                 else:
                     num_false_positive += 1
+            num_processed += 1
 
         # display results
-        num_processed = len(transform_all)
         print "sample size=%d, testing size=%d" % (len(sample), num_processed)
         print "%.2f correct" % ((float(num_right) / float(num_processed)) * 100.0)
         print "%.2f false negatives (kinda ok)" % ((float(num_false_negative) / float(num_processed)) * 100.0)
@@ -132,37 +283,44 @@ class LC(object):
 
     def run_tree(self, tree):
         '''
-        Run the testing data against the tree
+        Run the testing data against the tree (a decisionnode tree, a compiledtree
+        or the file name of one saved with treepredict.save_tree)
         '''
-        # first get a sample to use for training and make a tree from it
-        print "transforming test data"
-        test_data = []
-        for item in self.testing_data:
-            test_data.append(self.normalize_data(item))
-
         print "running..."
-        for item in test_data:
-            guess = treepredict.classify(item[0:-1], tree)
-            print "loan id=%s, results=%s" % (item[-1], guess)
+        if isinstance(tree, basestring):
+            tree = treepredict.load_tree(tree)
+        elif not isinstance(tree, treepredict.compiledtree):
+            tree = treepredict.compile_tree(tree)
+        columns = self.data_columns(testing=True)
+        if columns is not None:
+            # the columns are routed through the tree all in one go
+            guesses = [tree.results[n] for n in treepredict.route_batch(columns, tree)]
+            for c, guess in zip(columns.y.tolist(), guesses):
+                print "loan id=%s, results=%s" % (columns.labels[c], guess)
+        else:
+            for item in self.testing_rows():
+                print "loan id=%s, results=%s" % (item[-1], tree.classify(item[0:-1]))
 
 
     def compare_data(self):
         '''
         Compare the training and test data
         '''
-        print "training data keys=%s" % self.training_data[0].keys()
+        training_keys = iter(self.training_source()).next().keys()
+        testing_keys = iter(self.testing_source()).next().keys()
+        print "training data keys=%s" % training_keys
         print "\n"
-        print "test data keys=%s" % self.testing_data[0].keys()
+        print "test data keys=%s" % testing_keys
         print "\n"
 
         print "in training, missing from test:"
-        for col in self.training_data[0].keys():
-            if col not in self.testing_data[0].keys():
+        for col in training_keys:
+            if col not in testing_keys:
                 print col
         print "\n"
         print "in test, missing from training:"
-        for col in self.testing_data[0].keys():
-            if col not in self.training_data[0].keys():
+        for col in testing_keys:
+            if col not in training_keys:
                 print col
 
     def normalize_data(self, item):
@@ -183,10 +341,7 @@ class LC(object):
             row['Status'] = 'TEST'
 
         # calc monthly payment on testing based on amount requested
-        for col in ('Application Date', 'Application Expiration Date', 'Issued Date', 
-            'Remaining Principal Funded by Investors','Payments To Date (Funded by investors)','Remaining Principal ', 
-            ' Payments To Date','Screen Name', 'Code', 'Total Amount Funded', 'Number of Lenders', 'Expiration Date', 'APR', 'Amount Funded',
-            'Amount Funded By Investors', 'Loan Description', 'Loan Title', 'City', 'State', 'Location', 'Education'):
+        for col in self.DROPPED_COLUMNS:
             if col in row:
                 del row[col]
 
@@ -208,30 +363,13 @@ class LC(object):
             interest = principal * rate * (months / 12.0)
             # mp = principal + interest / # months
             row['Monthly PAYMENT'] = round(((principal + interest) / float(months)), 2)
-        ecl = datetime.datetime.strptime(row.pop('Earliest CREDIT Line'), '%Y-%m-%d')
-        row['Credit Line Age'] = ((datetime.datetime.now() - ecl).days) / 365
+        ecl = parse_date(row.pop('Earliest CREDIT Line'))
+        row['Credit Line Age'] = ((self.reference_date - ecl).days) / 365
 
 
         # convert numeric values
         for k, v in row.items():
-            try:
-                row[k] = int(v)
-            except ValueError:
-                if '%' in v:
-                    v = v.replace('%', '')
-                    has_percent = True
-                else:
-                    has_percent = False
-                try:
-                    row[k] = float(v)
-                except ValueError:
-                    try:
-                        json.dumps(v)
-                    except UnicodeDecodeError:
-                        row[k] = v.decode('latin-1')
-                    continue
-                if has_percent:
-                    row[k] /= 100.0
+            row[k] = convert_value(v)
 
         # handle employment
         # set(['5 years', '4 years', '10+ years', 'n/a', '6 years', '9 years', '8 years', '3 years', '2 years', '< 1 year', '1 year', '7 years'])
@@ -243,7 +381,7 @@ class LC(object):
         row['Employment Length'] = e
 
         # finally change some of financial figures to / 2500 to give us some more consistent bands
-        for col in ('Amount Requested','Amount Funded By Investors','Total Amount Funded'):
+        for col in self.BANDED_COLUMNS:
             if col in row:
                 row[col] = int(row[col]) / 2500
 
@@ -257,26 +395,162 @@ class LC(object):
         return [row[col] for col in cols]
 
 
-    def load_training_data(self, file_name):
+    def column_plan(self, header):
         '''
-        Load the data from file_name and make the all list
+        Work out once, from a CSV header, the columns normalize_data gives each row
+        (in order, with Status last) and a parser for each that goes straight from a
+        raw csv record to the normalized value, using SCHEMA for the known columns
+        '''
+        index = dict((name, i) for i, name in enumerate(header))
+        parsers = {}
+        for name in header:
+            if name in self.DROPPED_COLUMNS or name in ('Status', 'Earliest CREDIT Line'):
+                continue
+            parse = SCHEMA.get(name, parse_value)(index[name])
+            if name in self.BANDED_COLUMNS:
+                parse = banded(parse)
+            parsers[name] = parse
+        if 'CREDIT Grade' in parsers:
+            parsers['CREDIT Rating'] = parsers.pop('CREDIT Grade')
+        if 'Monthly PAYMENT' not in index:
+            parsers['Monthly PAYMENT'] = monthly_payment(index)
+        parsers['Credit Line Age'] = credit_line_age(index['Earliest CREDIT Line'], self.reference_date)
+        if 'Number of Lenders' in index:
+            parsers['Status'] = lambda record: 'TEST'
+        else:
+            status = index['Status']
+            parsers['Status'] = lambda record: 'BAD' if record[status] in self.BAD_STATUS else 'GOOD'
+
+        names = sorted(parsers.keys())
+        names.remove('Loan ID')
+        names.insert(0, 'Loan ID')
+        names.remove('Status')
+        names.append('Status')
+        return names, [parsers[name] for name in names]
+
+    def compile_normalizer(self, header):
+        '''
+        Compile normalize_data for files with this header: returns the column names
+        and a function taking a csv record (a list in header order) to the same list
+        normalize_data gives for it, with no per-row sorting, renaming or guessing
+        '''
+        names, parsers = self.column_plan(header)
+        return names, lambda record: [parse(record) for parse in parsers]
+
+    def normalize_rows(self, items):
+        '''
+        Yield normalize_data of each of items (dicts as csv.DictReader makes them, all
+        with the same columns), compiling the normalizer once from the first
+        '''
+        normalize = None
+        for item in items:
+            if normalize is None:
+                header = item.keys()
+                names, normalize = self.compile_normalizer(header)
+            yield normalize([item[name] for name in header])
+
+    def read_records(self, file_name, testing=False):
+        '''
+        Yield the header of file_name, then each csv record of it that read_training_data
+        (or read_testing_data) would, as a list padded out to the length of the header
+        '''
+        with open(file_name) as f:
+            reader = csv.reader(f)
+            header = reader.next()
+            yield header
+            status = header.index('Status') if 'Status' in header else None
+            # the testing data needs employment length and term
+            if testing and ('Employment Length' not in header or 'Loan Length' not in header):
+                status = None
+            for record in reader:
+                if not record:
+                    continue
+                if len(record) < len(header):
+                    record += [None] * (len(header) - len(record))
+                # skip lines that have the older credit policy
+                if status is None or not record[status] or 'Does not meet the current credit policy' in record[status]:
+                    continue
+                yield record
+
+    def read_rows(self, file_name, testing=False):
+        '''
+        Yield the normalized rows of file_name, read with a normalizer compiled from
+        its header rather than through a dict per row
+        '''
+        records = self.read_records(file_name, testing)
+        names, normalize = self.compile_normalizer(records.next())
+        for record in records:
+            yield normalize(record)
+
+    def read_columns(self, file_name, testing=False):
+        '''
+        Parse file_name straight into a treepredict.columnset (needs numpy), with no
+        dict or list per row: each cell is parsed by its column's parser into that
+        column's typed buffer. Returns the column names and the columnset, which holds
+        the same values as treepredict.columnset.fromrows on the normalized rows.
+        '''
+        records = self.read_records(file_name, testing)
+        names, parsers = self.column_plan(records.next())
+        label = parsers.pop()
+        buffers = [treepredict.columnbuffer() for parse in parsers]
+        columns = zip(buffers, parsers)
+        results = []
+        for record in records:
+            for buf, parse in columns:
+                buf.add(parse(record))
+            results.append(label(record))
+        return names[:-1], treepredict.columnset.frombuffers(buffers, results)
+
+    def cached_columns(self, file_name, testing=False):
+        '''
+        read_columns, but from the cache when file_name hasn't changed since it was
+        cached. A cached file is trusted if its size and modification time match and
+        otherwise only if its contents hash the same. Anything else (or a different
+        NORMALIZER_VERSION or reference_date) reads the file again and replaces the
+        cache.
+        '''
+        path = os.path.join(self.cache_dir, '%s.cols' % hashlib.sha1(
+            '%s:%s' % (os.path.abspath(file_name), testing)).hexdigest())
+        st = os.stat(file_name)
+        stamp = {'version': self.NORMALIZER_VERSION, 'reference': self.reference_date.toordinal()}
+        if os.path.exists(path):
+            try:
+                columns, extra = treepredict.load_columnset(path)
+            except ValueError:
+                extra = None
+            if extra and all(extra.get(k) == v for k, v in stamp.items()):
+                if (extra['size'], extra['mtime']) == (st.st_size, st.st_mtime) or \
+                        extra['sha1'] == file_sha1(file_name):
+                    return extra['names'], columns
+
+        names, columns = self.read_columns(file_name, testing)
+        stamp.update(names=names, size=st.st_size, mtime=st.st_mtime, sha1=file_sha1(file_name))
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        # written to the side and renamed over the old one, so a reader never sees half
+        temp = '%s.%d' % (path, os.getpid())
+        treepredict.save_columnset(columns, temp, stamp)
+        os.rename(temp, path)
+        return names, columns
+
+    def read_training_data(self, file_name):
+        '''
+        Yield the lines of file_name we train on, one at a time, without keeping them
         '''
         with open(file_name) as f:
-            print "loading from %s..." % file_name
             dr = csv.DictReader(f)
             for line in dr:
                 # skip lines that have the older credit policy
                 if not line.get('Status') or 'Does not meet the current credit policy' in line.get('Status'):
                     continue
 
-                self.training_data.append(line)
-    
-    def load_testing_data(self, file_name):
+                yield line
+
+    def read_testing_data(self, file_name):
         '''
-        Load the data from file_name and make the testing list
+        Yield the lines of file_name we test on, one at a time, without keeping them
         '''
         with open(file_name) as f:
-            print "loading from %s..." % file_name
             dr = csv.DictReader(f)
             for line in dr:
                 # skip lines that have the older credit policy
@@ -290,9 +564,212 @@ class LC(object):
                 if 'Loan Length' not in line:
                     continue
 
-                self.testing_data.append(line)
+                yield line
+
+    def load_training_data(self, file_name):
+        '''
+        Load the data from file_name and make the all list
+        '''
+        print "loading from %s..." % file_name
+        self.training_data.extend(self.read_training_data(file_name))
+    
+    def load_testing_data(self, file_name):
+        '''
+        Load the data from file_name and make the testing list
+        '''
+        print "loading from %s..." % file_name
+        self.testing_data.extend(self.read_testing_data(file_name))
     
 
+def convert_value(v):
+    '''
+    Turn one cell into an int, a float (percentages divided by 100) or a string,
+    trying each in turn the way normalize_data always has
+    '''
+    try:
+        return int(v)
+    except ValueError:
+        pass
+    stripped = v.replace('%', '')
+    try:
+        value = float(stripped)
+    except ValueError:
+        try:
+            json.dumps(stripped)
+        except UnicodeDecodeError:
+            return stripped.decode('latin-1')
+        return v
+    if stripped != v:
+        value /= 100.0
+    return value
+
+
+# Each parser below is made for one column, given its index in a csv record, and
+# turns the raw string into exactly what convert_value (and the rest of
+# normalize_data) would. The common, well-formed case is handled directly and
+# anything else goes through convert_value.
+
+def parse_value(i):
+    return lambda record: convert_value(record[i])
+
+
+def convert_number(v):
+    '''
+    convert_value for a cell that should hold a number. Plain whole and decimal
+    numbers and blanks are told apart by looking at them, and only anything else
+    goes through convert_value.
+    '''
+    if v.isdigit():
+        return int(v)
+    if v.replace('.', '', 1).isdigit():
+        return float(v)
+    if not v:
+        return ''
+    return convert_value(v)
+
+
+def text(v):
+    '''
+    A cell that holds words, as convert_value leaves it: the string itself, or
+    (less any %) decoded as latin-1 if it isn't utf-8
+    '''
+    try:
+        v.decode('utf-8')
+    except UnicodeDecodeError:
+        return v.replace('%', '').decode('latin-1')
+    return v
+
+
+def parse_string(i):
+    # nominal columns only have a few different values, so each is worked out once
+    seen = {}
+    def parse(record):
+        v = record[i]
+        if v not in seen:
+            seen[v] = text(v)
+        return seen[v]
+    return parse
+
+
+def parse_number(i):
+    return lambda record: convert_number(record[i])
+
+
+def parse_percent(i):
+    def parse(record):
+        v = record[i]
+        if v[-1:] == '%' and v[:-1].replace('.', '', 1).isdigit():
+            return float(v[:-1]) / 100.0
+        return convert_number(v)
+    return parse
+
+
+def parse_months(i):
+    return lambda record: convert_number(record[i].replace(' months', ''))
+
+
+def parse_employment(i):
+    # there are only a dozen or so different values, so each is worked out once
+    seen = {}
+    def parse(record):
+        v = record[i]
+        if v not in seen:
+            e = convert_value(v)
+            e = e.replace(' years', '')
+            e = e.replace(' year', '')
+            e = e.replace('n/a', '0')
+            e = e.replace('< 1', '0.5')
+            e = e.replace('10+', '10.0')
+            seen[v] = e
+        return seen[v]
+    return parse
+
+
+def banded(parse):
+    return lambda record: int(parse(record)) / 2500
+
+
+def monthly_payment(index):
+    '''
+    A parser working out the monthly payment (for the testing data, which doesn't
+    have one) from the amount requested, length and interest rate
+    '''
+    amount, length, rate = index.get('Amount Requested'), index['Loan Length'], index['Interest Rate']
+    def parse(record):
+        principal = float(record[amount] if amount is not None else '0.0')
+        months = int(record[length].replace(' months', ''))
+        interest = principal * (float(record[rate].replace('%', '')) / 100.0) * (months / 12.0)
+        return convert_value(round(((principal + interest) / float(months)), 2))
+    return parse
+
+
+# every date parse_date has seen, as there are only a few thousand different ones
+PARSED_DATES = {}
+
+
+def parse_date(v):
+    '''
+    The date in v (YYYY-MM-DD), parsed once for each different v
+    '''
+    if v not in PARSED_DATES:
+        PARSED_DATES[v] = datetime.datetime.strptime(v, '%Y-%m-%d').date()
+    return PARSED_DATES[v]
+
+
+def credit_line_age(i, reference_date):
+    '''
+    A parser giving the whole years from Earliest CREDIT Line to reference_date,
+    worked out once for each different date
+    '''
+    ages = {}
+    def parse(record):
+        v = record[i]
+        if v not in ages:
+            ages[v] = ((reference_date - parse_date(v)).days) / 365
+        return ages[v]
+    return parse
+
+
+# How the known Lending Club columns are parsed. Anything else gets parse_value.
+SCHEMA = {
+    'Loan ID': parse_number,
+    'Amount Requested': parse_number,
+    'Interest Rate': parse_percent,
+    'Loan Length': parse_months,
+    'Monthly PAYMENT': parse_number,
+    'Monthly Income': parse_number,
+    'Debt-To-Income Ratio': parse_percent,
+    'Revolving Line Utilization': parse_percent,
+    'Open CREDIT Lines': parse_number,
+    'Total CREDIT Lines': parse_number,
+    'Revolving CREDIT Balance': parse_number,
+    'Inquiries in the Last 6 Months': parse_number,
+    'Accounts Now Delinquent': parse_number,
+    'Delinquent Amount': parse_number,
+    'Delinquencies (Last 2 yrs)': parse_number,
+    'Months Since Last Delinquency': parse_number,
+    'Public Records On File': parse_number,
+    'Months Since Last Record': parse_number,
+    'Employment Length': parse_employment,
+    'CREDIT Grade': parse_string,
+    'CREDIT Rating': parse_string,
+    'Home Ownership': parse_string,
+    'Loan Purpose': parse_string,
+    'FICO Range': parse_string,
+}
+
+
+def file_sha1(file_name, block=1 << 20):
+    '''
+    The hex sha1 of the contents of file_name, read a block at a time
+    '''
+    digest = hashlib.sha1()
+    with open(file_name, 'rb') as f:
+        for data in iter(lambda: f.read(block), ''):
+            digest.update(data)
+    return digest.hexdigest()
+
+
 if __name__ == '__main__':
     lc = LC()
     lc.load_data(sys.argv[0])
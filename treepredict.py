@@ -1,3 +1,31 @@
+from array import array
+from bisect import bisect_right
+from heapq import heappush,heappop
+from math import log
+import imp
+import json
+import mmap
+import random
+import struct
+
+# numpy takes longer to import than everything else put together,
+# so it is only imported the first time it is used. numpy is None
+# when it isn't installed.
+class _lazymodule(object):
+  def __init__(self,name):
+    self.name=name
+    self.module=None
+
+  def __getattr__(self,attr):
+    if self.module==None: self.module=__import__(self.name)
+    return getattr(self.module,attr)
+
+try:
+  imp.find_module('numpy')
+  numpy=_lazymodule('numpy')
+except ImportError:
+  numpy=None
+
 my_data=[['slashdot','USA','yes',18,'None'],
         ['google','France','yes',23,'Premium'],
         ['digg','USA','yes',24,'Basic'],
@@ -22,23 +50,51 @@ class decisionnode:
     self.results=results
     self.tb=tb
     self.fb=fb
+    self.counts=None
+    self.total=None
 
 # Divides a set on a specific column. Can handle numeric
 # or nominal values
 def divideset(rows,column,value):
    # Make a function that tells us if a row is in 
    # the first group (true) or the second group (false)
-   split_function=None
-   if isinstance(value,int) or isinstance(value,float):
-      split_function=lambda row:row[column]>=value
-   else:
-      split_function=lambda row:row[column]==value
+   split_function=splitfunction(column,value)
    
    # Divide the rows into two sets and return them
    set1=[row for row in rows if split_function(row)]
    set2=[row for row in rows if not split_function(row)]
    return (set1,set2)
 
+def splitfunction(column,value):
+   if isinstance(value,frozenset):
+      return lambda row:row[column] in value
+   if isinstance(value,int) or isinstance(value,float):
+      return lambda row:row[column]>=value
+   else:
+      return lambda row:row[column]==value
+
+# Reorder index[lo:hi] so the rows passing test come first and
+# return where they stop. This is how the tree builders split a
+# node without copying any rows.
+def partition(index,lo,hi,test):
+   node=index[lo:hi]
+   set1=[i for i in node if test(i)]
+   index[lo:hi]=set1+[i for i in node if not test(i)]
+   return lo+len(set1)
+
+# A read-only view of the rows listed in index
+class _IndexedRows:
+   def __init__(self,rows,index):
+      self.rows=rows
+      self.index=index
+
+   def __len__(self):
+      return len(self.index)
+
+   def __iter__(self):
+      rows=self.rows
+      for i in self.index: yield rows[i]
+
 
 # Create counts of possible results (the last column of 
 # each row is the result)
@@ -54,156 +110,777 @@ def uniquecounts(rows):
 # Probability that a randomly placed item will
 # be in the wrong category
 def giniimpurity(rows):
-  total=len(rows)
-  counts=uniquecounts(rows)
-  imp=0
-  for k1 in counts:
-    p1=float(counts[k1])/total
-    for k2 in counts:
-      if k1==k2: continue
-      p2=float(counts[k2])/total
-      imp+=p1*p2
-  return imp
+  return giniofcounts(uniquecounts(rows).values(),len(rows))
 
 # Entropy is the sum of p(x)log(p(x)) across all 
 # the different possible results
 def entropy(rows):
-   from math import log
-   log2=lambda x:log(x)/log(2)  
-   results=uniquecounts(rows)
-   # Now calculate the entropy
-   ent=0.0
-   for r in results.keys():
-      p=float(results[r])/len(rows)
-      ent=ent-p*log2(p)
-   return ent
+   return entropyofcounts(uniquecounts(rows).values(),len(rows))
 
+# The same two scores worked out from a list of how many rows
+# have each result (total is their sum, if it's already known).
+# These cost O(results) rather than O(rows), which is what makes
+# scoring every candidate split affordable.
+def giniofcounts(counts,total=None):
+  if total==None: total=sum(counts)
+  if total==0: return 0.0
+  return 1.0-float(sum([c*c for c in counts]))/(total*total)
+
+# Entropy from counts is (n*log2(n) - sum(c*log2(c)))/n, and the
+# c*log2(c) terms for whole counts come from a table that grows as
+# bigger counts turn up, so most scores don't call log at all.
+# Counts that aren't whole numbers are worked out directly.
+LOG2=log(2)
+LOG_TABLE_SIZE=1<<16
+_xlogx=[0.0,0.0]
+
+def _xlog2x(c):
+   if isinstance(c,(int,long)):
+      if c<len(_xlogx): return _xlogx[c]
+      if c<LOG_TABLE_SIZE:
+         for i in range(len(_xlogx),c+1): _xlogx.append(i*log(i)/LOG2)
+         return _xlogx[c]
+   if c<=0: return 0.0
+   return c*log(c)/LOG2
+
+def entropyofcounts(counts,total=None):
+   if total==None: total=sum(counts)
+   if total==0: return 0.0
+   ent=_xlog2x(total)
+   for c in counts:
+      ent-=_xlog2x(c)
+   return max(ent/total,0.0)
+
+_countscores={giniimpurity:giniofcounts,entropy:entropyofcounts,
+              giniofcounts:giniofcounts,entropyofcounts:entropyofcounts}
+
+# And again for a whole array of count vectors at once (one row
+# per candidate split), for the numpy code paths
+def _giniofcountarrays(counts,totals):
+  p=counts/numpy.maximum(totals,1).astype(float)[:,None]
+  return 1.0-(p*p).sum(axis=1)
+
+def _entropyofcountarrays(counts,totals):
+  p=counts/numpy.maximum(totals,1).astype(float)[:,None]
+  logs=numpy.log2(numpy.where(p>0,p,1.0))
+  return -(p*logs).sum(axis=1)
+
+_arrayscores={giniimpurity:_giniofcountarrays,entropy:_entropyofcountarrays,
+              giniofcounts:_giniofcountarrays,entropyofcounts:_entropyofcountarrays}
 
 
 
 def printtree(tree,indent=''):
-   # Is this a leaf node?
-   if tree.results!=None:
-      print str(tree.results)
-   else:
-      # Print the criteria
-      print str(tree.col)+':'+str(tree.value)+'? '
+   # Each node still to print, with the branch label that goes
+   # in front of it
+   stack=[(None,tree,indent)]
+   while len(stack)>0:
+      label,tree,indent=stack.pop()
+      if label!=None: print label,
+      # Is this a leaf node?
+      if tree.results!=None:
+         print str(tree.results)
+      else:
+         # Print the criteria
+         print str(tree.col)+':'+str(tree.value)+'? '
 
-      # Print the branches
-      print indent+'T->',
-      printtree(tree.tb,indent+'  ')
-      print indent+'F->',
-      printtree(tree.fb,indent+'  ')
+         # Print the branches
+         stack.append((indent+'F->',tree.fb,indent+'  '))
+         stack.append((indent+'T->',tree.tb,indent+'  '))
 
 
 def getwidth(tree):
-  if tree.tb==None and tree.fb==None: return 1
-  return getwidth(tree.tb)+getwidth(tree.fb)
+  width=0
+  stack=[tree]
+  while len(stack)>0:
+    node=stack.pop()
+    if node.tb==None and node.fb==None: width+=1
+    else: stack.extend((node.tb,node.fb))
+  return width
 
 def getdepth(tree):
-  if tree.tb==None and tree.fb==None: return 0
-  return max(getdepth(tree.tb),getdepth(tree.fb))+1
+  depth=0
+  stack=[(tree,0)]
+  while len(stack)>0:
+    node,level=stack.pop()
+    if node.tb==None and node.fb==None: depth=max(depth,level)
+    else: stack.extend(((node.tb,level+1),(node.fb,level+1)))
+  return depth
 
 
-from PIL import Image,ImageDraw
+# Work out the width in leaves of every subtree, and the depth of
+# the whole tree, in one post-order pass. Below maxdepth levels a
+# subtree is cut off and counts as a single leaf. Widths are kept
+# by id(node).
+def layoutwidths(tree,maxdepth=None):
+  widths={}
+  depth=0
+  stack=[(tree,0,False)]
+  while len(stack)>0:
+    node,level,ready=stack.pop()
+    if (node.tb==None and node.fb==None) or level==maxdepth:
+      widths[id(node)]=1
+      depth=max(depth,level)
+    elif ready:
+      widths[id(node)]=widths[id(node.tb)]+widths[id(node.fb)]
+    else:
+      stack.append((node,level,True))
+      stack.append((node.fb,level+1,False))
+      stack.append((node.tb,level+1,False))
+  return widths,depth
 
-def drawtree(tree,jpeg='tree.jpg'):
-  w=getwidth(tree)*100
-  h=getdepth(tree)*100+120
+# Place every node of the tree, in preorder, spacing leaves
+# spacing pixels apart with the root at (x,y). Yields
+# (node,x,y,parent,branch,cut): parent is the (x,y) of the node's
+# parent (None for the root), branch is True or False for which
+# branch of the parent it is, and cut says the node is drawn as a
+# summary of its subtree because it is maxdepth levels down.
+def layouttree(tree,x,y,maxdepth=None,widths=None,spacing=100):
+  if widths==None: widths=layoutwidths(tree,maxdepth)[0]
+  stack=[(tree,x,y,None,None,0)]
+  while len(stack)>0:
+    node,x,y,parent,branch,level=stack.pop()
+    leaf=node.tb==None and node.fb==None
+    yield (node,x,y,parent,branch,not leaf and level==maxdepth)
+    if leaf or level==maxdepth: continue
+
+    # Split the space under the node between the branches
+    w1=widths[id(node.fb)]*spacing
+    w2=widths[id(node.tb)]*spacing
+    left=x-(w1+w2)/2
+    right=x+(w1+w2)/2
+    stack.append((node.tb,right-w2/2,y+spacing,(x,y),True,level+1))
+    stack.append((node.fb,left+w1/2,y+spacing,(x,y),False,level+1))
+
+# The lines of text drawn for a node
+def nodelabel(node,cut=False):
+  if cut:
+    counts=node.counts
+    if counts==None: counts=cachecounts(node).counts
+    return ['...']+['%s:%d'%v for v in sorted(counts.items())]
+  if node.tb==None and node.fb==None:
+    return ['%s:%d'%v for v in node.results.items()]
+  return [str(node.col)+':'+str(node.value)]
+
+# PIL is only imported when a tree is drawn, so scoring jobs don't
+# pay for it (or need it). Below maxdepth levels each subtree is
+# drawn as one node with its result counts.
+def drawtree(tree,jpeg='tree.jpg',maxdepth=None):
+  from PIL import Image,ImageDraw
+  widths,depth=layoutwidths(tree,maxdepth)
+  w=widths[id(tree)]*100
+  h=depth*100+120
 
   img=Image.new('RGB',(w,h),(255,255,255))
   draw=ImageDraw.Draw(img)
 
-  drawnode(draw,tree,w/2,20)
+  drawnode(draw,tree,w/2,20,maxdepth,widths)
   img.save(jpeg,'JPEG')
-  
-def drawnode(draw,tree,x,y):
-  if tree.results==None:
-    # Get the width of each branch
-    w1=getwidth(tree.fb)*100
-    w2=getwidth(tree.tb)*100
-
-    # Determine the total space required by this node
-    left=x-(w1+w2)/2
-    right=x+(w1+w2)/2
 
-    # Draw the condition string
-    draw.text((x-20,y-10),str(tree.col)+':'+str(tree.value),(0,0,0))
+def drawnode(draw,tree,x,y,maxdepth=None,widths=None):
+  for node,x,y,parent,branch,cut in layouttree(tree,x,y,maxdepth,widths):
+    # Draw the link from the parent
+    if parent!=None:
+      draw.line((parent[0],parent[1],x,y),fill=(255,0,0))
+    if node.tb==None and node.fb==None or cut:
+      draw.text((x-20,y),' \n'.join(nodelabel(node,cut)),(0,0,0))
+    else:
+      draw.text((x-20,y-10),nodelabel(node)[0],(0,0,0))
+
+# Write the tree as an SVG image, one node at a time, with the
+# same layout drawtree uses. It works for trees far too wide for
+# a JPEG since nothing is held in memory but the subtree widths.
+def writesvg(tree,filename,maxdepth=None):
+  from xml.sax.saxutils import escape
+  widths,depth=layoutwidths(tree,maxdepth)
+  w=widths[id(tree)]*100
+  h=depth*100+120
+  f=open(filename,'w')
+  try:
+    f.write('<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" '
+            'font-family="sans-serif" font-size="10">\n' % (w,h))
+    for node,x,y,parent,branch,cut in layouttree(tree,w/2,20,maxdepth,widths):
+      if parent!=None:
+        f.write('<line x1="%d" y1="%d" x2="%d" y2="%d" stroke="red"/>\n' %
+                (parent[0],parent[1],x,y))
+      lines=nodelabel(node,cut)
+      f.write('<text x="%d" y="%d">' % (x-20,y))
+      for i,line in enumerate(lines):
+        f.write('<tspan x="%d" dy="%d">%s</tspan>' %
+                (x-20,i and 12 or 0,escape(_text(line))))
+      f.write('</text>\n')
+    f.write('</svg>\n')
+  finally:
+    f.close()
 
-    # Draw links to the branches
-    draw.line((x,y,left+w1/2,y+100),fill=(255,0,0))
-    draw.line((x,y,right-w2/2,y+100),fill=(255,0,0))
-    
-    # Draw the branch nodes
-    drawnode(draw,tree.fb,left+w1/2,y+100)
-    drawnode(draw,tree.tb,right-w2/2,y+100)
-  else:
-    txt=' \n'.join(['%s:%d'%v for v in tree.results.items()])
-    draw.text((x-20,y),txt,(0,0,0))
+# Write the tree in Graphviz's DOT language, one node at a time.
+# Graphviz does the layout, so no widths are needed at all.
+def writedot(tree,filename,maxdepth=None):
+  f=open(filename,'w')
+  try:
+    f.write('digraph tree {\n  node [shape=box];\n')
+    stack=[(tree,None,None,0)]
+    n=0
+    while len(stack)>0:
+      node,parent,branch,level=stack.pop()
+      leaf=node.tb==None and node.fb==None
+      cut=not leaf and level==maxdepth
+      label='\\n'.join([_text(line).replace('\\','\\\\').replace('"','\\"')
+                        for line in nodelabel(node,cut)])
+      f.write('  n%d [label="%s"];\n' % (n,label))
+      if parent!=None:
+        f.write('  n%d -> n%d [label="%s"];\n' % (parent,n,branch and 'T' or 'F'))
+      if not leaf and not cut:
+        stack.append((node.fb,n,False,level+1))
+        stack.append((node.tb,n,True,level+1))
+      n+=1
+    f.write('}\n')
+  finally:
+    f.close()
+
+def _text(line):
+  if isinstance(line,unicode): return line.encode('utf-8')
+  return line
 
 
 def classify(observation,tree):
-  if tree.results!=None:
-    return tree.results
-  else:
-    v=observation[tree.col]
-    branch=None
-    if isinstance(v,int) or isinstance(v,float):
-      if v>=tree.value: branch=tree.tb
-      else: branch=tree.fb
+  if isinstance(tree,compiledtree):
+    return tree.classify(observation)
+  # Follow the observation down to a leaf
+  while tree.results==None:
+    tree=_branch(tree,observation[tree.col])
+  return tree.results
+
+# A tree flattened into parallel lists indexed by node number,
+# with the root at 0. Leaves have a col of -1 and their result
+# counts in results; every other node splits on col at value and
+# goes on to node tb[n] or fb[n]. numeric[n] says whether the
+# split is a threshold (>=) or an equality test. labels are all
+# the results found in the leaves, in sorted order.
+class compiledtree:
+  def __init__(self,cols,values,numeric,tb,fb,results):
+    self.cols=cols
+    self.values=values
+    self.numeric=numeric
+    self.tb=tb
+    self.fb=fb
+    self.results=results
+    found={}
+    for r in results:
+      # Leaves that hold a number (as in boost) have no labels
+      if isinstance(r,dict): found.update(r)
+    self.labels=sorted(found.keys())
+
+  def __len__(self):
+    return len(self.cols)
+
+  # Same answers as classify, walking the lists in a loop
+  def classify(self,observation):
+    cols,values,tb,fb=self.cols,self.values,self.tb,self.fb
+    n=0
+    col=cols[0]
+    while col>=0:
+      v=observation[col]
+      value=values[n]
+      if isinstance(value,frozenset):
+        if v in value: n=tb[n]
+        else: n=fb[n]
+      elif isinstance(v,int) or isinstance(v,float):
+        if v>=value: n=tb[n]
+        else: n=fb[n]
+      else:
+        if v==value: n=tb[n]
+        else: n=fb[n]
+      col=cols[n]
+    return self.results[n]
+
+# Flatten a decisionnode tree into a compiledtree
+def compile_tree(tree):
+  cols,values,numeric,tb,fb,results=[],[],[],[],[],[]
+  # Each entry is a node to number and where to record its number
+  stack=[(tree,None,None)]
+  while len(stack)>0:
+    node,parent,branch=stack.pop()
+    n=len(cols)
+    if parent!=None: branch[parent]=n
+    if node.tb==None and node.fb==None:
+      cols.append(-1)
+      values.append(None)
+      numeric.append(False)
+      results.append(node.results)
     else:
-      if v==tree.value: branch=tree.tb
-      else: branch=tree.fb
-    return classify(observation,branch)
+      cols.append(node.col)
+      values.append(node.value)
+      numeric.append(isinstance(node.value,int) or isinstance(node.value,float))
+      results.append(None)
+    tb.append(-1)
+    fb.append(-1)
+    if cols[n]>=0:
+      stack.append((node.fb,n,fb))
+      stack.append((node.tb,n,tb))
+  return compiledtree(cols,values,numeric,tb,fb,results)
+
+# Turn a compiledtree back into a tree of decisionnodes
+def _decisionnodes(tree):
+  nodes=[decisionnode(col=tree.cols[n],value=tree.values[n],results=tree.results[n])
+         for n in range(0,len(tree))]
+  for n in range(0,len(tree)):
+    if tree.cols[n]>=0: nodes[n].tb,nodes[n].fb=nodes[tree.tb[n]],nodes[tree.fb[n]]
+  return nodes[0]
+
+# Generated code nests no deeper than this inside one function;
+# deeper subtrees become functions of their own
+PYTHON_MAX_NESTING=50
+
+# Write a tree out as the source of a Python module with one
+# function, name(observation), that returns what classify would
+# for the tree, using nothing but nested ifs on constants
+def tree_to_python(tree,name='classify'):
+  if not isinstance(tree,compiledtree): tree=compile_tree(tree)
+  lines=['# Generated by treepredict.tree_to_python',
+         'NUM=(int,float)']
+  for n in range(0,len(tree)):
+    if tree.cols[n]<0: lines.append('_R%d=%r' % (n,tree.results[n]))
+    elif isinstance(tree.values[n],frozenset): lines.append('_S%d=%r' % (n,tree.values[n]))
+
+  functions=[(name,0)]
+  while len(functions)>0:
+    fname,root=functions.pop()
+    lines.append('')
+    lines.append('def %s(observation):' % fname)
+    stack=[(root,1)]
+    while len(stack)>0:
+      n,depth=stack.pop()
+      indent='  '*depth
+      if isinstance(n,str):
+        lines.append(indent+n)
+      elif tree.cols[n]<0:
+        lines.append(indent+'return _R%d' % n)
+      elif depth>PYTHON_MAX_NESTING:
+        functions.append(('_n%d' % n,n))
+        lines.append(indent+'return _n%d(observation)' % n)
+      else:
+        # The same tests classify makes: numbers are compared with
+        # >=, anything else with ==, and every number is >= None
+        value=tree.values[n]
+        if isinstance(value,frozenset): test='v in _S%d' % n
+        elif tree.numeric[n]: test='isinstance(v,NUM) and v>=%r or v==%r' % (value,value)
+        elif value==None: test='v==None or isinstance(v,NUM)'
+        else: test='v==%r' % (value,)
+        lines.append(indent+'v=observation[%d]' % tree.cols[n])
+        lines.append(indent+'if %s:' % test)
+        stack.append((tree.fb[n],depth+1))
+        stack.append(('else:',depth))
+        stack.append((tree.tb[n],depth+1))
+  return '\n'.join(lines)+'\n'
 
+# Turn a tree into a Python function by generating its source and
+# running it
+def compile_python(tree,name='classify'):
+  namespace={}
+  exec compile(tree_to_python(tree,name),'<tree>','exec') in namespace
+  return namespace[name]
+
+# Write the generated module to a file, from which it can be
+# imported (and cached as a .pyc) like any other
+def write_python(tree,filename,name='classify'):
+  f=open(filename,'w')
+  try:
+    f.write(tree_to_python(tree,name))
+  finally:
+    f.close()
+
+# A mask of which of the rows of a columnset go down the true
+# branch of a split, deciding each row the same way classify would
+def _batchmask(matrix,col,value,rows):
+  values,codes=matrix.values[col],matrix.codes[col]
+  if isinstance(value,frozenset):
+    if codes is None: return numpy.zeros(len(rows),dtype=bool)
+    members=[i for i,c in enumerate(matrix.categories[col]) if c in value]
+    return numpy.in1d(codes[rows],members)
+  if isinstance(value,int) or isinstance(value,float):
+    # Only numbers are compared against a threshold; anything
+    # else is tested for equality with it, which fails
+    if values is None: return numpy.zeros(len(rows),dtype=bool)
+    mask=values[rows]>=value
+    if codes is not None: mask&=codes[rows]<0
+    return mask
+  mask=numpy.zeros(len(rows),dtype=bool)
+  if codes is not None and value in matrix.categories[col]:
+    mask=codes[rows]==matrix.categories[col].index(value)
+  # A number compared with >= against None is always true
+  if value==None and values is not None:
+    if codes is None: mask[:]=True
+    else: mask|=codes[rows]<0
+  return mask
+
+# Send every row of a columnset (matrix) through the tree at once,
+# a level at a time, splitting arrays of row numbers at each node.
+# Returns the number of the compiledtree leaf each row lands in.
+def route_batch(matrix,tree):
+  if not isinstance(tree,compiledtree): tree=compile_tree(tree)
+  leaves=numpy.zeros(len(matrix),dtype=numpy.intp)
+  level=[(0,numpy.arange(len(matrix)))]
+  while len(level)>0:
+    below=[]
+    for n,rows in level:
+      col=tree.cols[n]
+      if col<0:
+        leaves[rows]=n
+        continue
+      mask=_batchmask(matrix,col,tree.values[n],rows)
+      if mask.any(): below.append((tree.tb[n],rows[mask]))
+      if not mask.all(): below.append((tree.fb[n],rows[~mask]))
+    level=below
+  return leaves
+
+# Classify every row of a columnset at once. Returns an array with
+# a row for each row of the matrix and a column for each of the
+# tree's labels (see compiledtree), holding the fraction of the
+# training rows in its leaf that had that result.
+def classify_batch(matrix,tree):
+  if not isinstance(tree,compiledtree): tree=compile_tree(tree)
+  labelindex=dict([(l,i) for i,l in enumerate(tree.labels)])
+  probabilities=numpy.zeros((len(tree),len(tree.labels)))
+  for n in range(0,len(tree)):
+    results=tree.results[n]
+    if not results: continue
+    total=float(sum(results.values()))
+    for r,c in results.items():
+      probabilities[n,labelindex[r]]=c/total
+  return probabilities[route_batch(matrix,tree)]
+
+# A tree saved with save_tree is one file: a header, a JSON
+# dictionary of the labels, the categories that nominal splits
+# test for, the sets of them that set splits test for (as lists of
+# category numbers) and (optionally) the feature names, then the
+# nodes of the compiledtree as flat arrays of little-endian numbers:
+#   numbers  float64[nodes]         threshold, category or set number
+#   counts   float64[nodes*labels]  result counts of the leaves
+#   cols     int32[nodes]
+#   tb, fb   int32[nodes]
+#   kinds    int8[nodes]            one of the MODEL_ kinds below
+# load_tree maps the file into memory and reads nodes straight out
+# of it, so processes scoring with the same file share its pages.
+MODEL_MAGIC='LCTREE\0\0'
+MODEL_VERSION=2
+MODEL_HEADER='<8sIIII'
+MODEL_LEAF,MODEL_FLOAT,MODEL_INT,MODEL_CATEGORY,MODEL_CATEGORYSET=0,1,2,3,4
+
+def save_tree(tree,filename,features=None):
+  if not isinstance(tree,compiledtree): tree=compile_tree(tree)
+  n,labels=len(tree),list(tree.labels)
+  labelindex=dict([(l,i) for i,l in enumerate(labels)])
+  categories,categoryindex,sets=[],{},[]
+  def category(value):
+    if value not in categoryindex:
+      categoryindex[value]=len(categories)
+      categories.append(value)
+    return categoryindex[value]
+
+  numbers,kinds,counts=[],[],[0.0]*(n*len(labels))
+  for i in range(0,n):
+    value=tree.values[i]
+    if tree.cols[i]<0:
+      numbers.append(0.0)
+      kinds.append(MODEL_LEAF)
+      for r,c in tree.results[i].items(): counts[i*len(labels)+labelindex[r]]=c
+    elif isinstance(value,frozenset):
+      numbers.append(len(sets))
+      kinds.append(MODEL_CATEGORYSET)
+      sets.append(sorted([category(v) for v in value]))
+    elif isinstance(value,int) or isinstance(value,float):
+      numbers.append(value)
+      kinds.append(isinstance(value,int) and MODEL_INT or MODEL_FLOAT)
+    else:
+      numbers.append(category(value))
+      kinds.append(MODEL_CATEGORY)
+  # JSON only has unicode strings, so note which were plain ones
+  strs=dict([(name,[i for i,v in enumerate(values) if isinstance(v,str)])
+             for name,values in (('labels',labels),('categories',categories))])
+  dictionary=json.dumps({'labels':labels,'categories':categories,'sets':sets,
+                         'str':strs,'features':features})
+  dictionary+=' '*(-(struct.calcsize(MODEL_HEADER)+len(dictionary))%8)
+
+  f=open(filename,'wb')
+  try:
+    f.write(struct.pack(MODEL_HEADER,MODEL_MAGIC,MODEL_VERSION,n,len(labels),len(dictionary)))
+    f.write(dictionary)
+    f.write(struct.pack('<%dd' % n,*numbers))
+    f.write(struct.pack('<%dd' % len(counts),*counts))
+    for a in (tree.cols,tree.tb,tree.fb):
+      f.write(struct.pack('<%di' % n,*a))
+    f.write(struct.pack('<%db' % n,*kinds))
+  finally:
+    f.close()
+
+# A read-only list of numbers packed in a buffer, read one at a time
+class _packedarray:
+  def __init__(self,buf,offset,code,count):
+    self.buf=buf
+    self.offset=offset
+    self.code='<'+code
+    self.size=struct.calcsize(self.code)
+    self.count=count
+
+  def __len__(self):
+    return self.count
+
+  def __getitem__(self,i):
+    return struct.unpack_from(self.code,self.buf,self.offset+i*self.size)[0]
+
+# An array over a buffer without copying it: a numpy array if
+# numpy is there, a _packedarray if not
+def _maparray(buf,offset,code,count):
+  if numpy==None: return _packedarray(buf,offset,code,count)
+  return numpy.frombuffer(buf,dtype='<'+code,count=count,offset=offset)
+
+# A read-only list whose items are worked out when asked for
+class _lazylist:
+  def __init__(self,count,get):
+    self.count=count
+    self.get=get
+
+  def __len__(self):
+    return self.count
+
+  def __getitem__(self,i):
+    return self.get(i)
+
+# JSON gives back unicode; make the values at the indexes in strs
+# plain (utf-8) strings again. Files saved before strs was kept
+# just get their ASCII strings made plain.
+def _native(values,strs=None):
+  if strs!=None:
+    strs=set(strs)
+    return [i in strs and v.encode('utf-8') or v for i,v in enumerate(values)]
+  result=[]
+  for v in values:
+    if isinstance(v,unicode):
+      try: v=v.encode('ascii')
+      except UnicodeEncodeError: pass
+    result.append(v)
+  return result
+
+# A compiledtree whose lists are views of a file saved with
+# save_tree. It can be used anywhere a compiledtree can.
+class mappedtree(compiledtree):
+  def __init__(self,filename):
+    f=open(filename,'rb')
+    try:
+      self.buf=mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+    finally:
+      f.close()
+    magic,version,n,nlabels,size=struct.unpack_from(MODEL_HEADER,self.buf,0)
+    if magic!=MODEL_MAGIC: raise ValueError('%s is not a saved tree' % filename)
+    if version<1 or version>MODEL_VERSION:
+      raise ValueError('%s is a version %d tree, expected at most %d' %
+                       (filename,version,MODEL_VERSION))
+    offset=struct.calcsize(MODEL_HEADER)
+    dictionary=json.loads(self.buf[offset:offset+size])
+    strs=dictionary.get('str',{})
+    self.labels=_native(dictionary['labels'],strs.get('labels'))
+    self.categories=_native(dictionary['categories'],strs.get('categories'))
+    self.sets=[frozenset([self.categories[c] for c in members])
+               for members in dictionary.get('sets',[])]
+    self.features=dictionary['features']
+
+    offset+=size
+    self.numbers=_maparray(self.buf,offset,'d',n)
+    offset+=8*n
+    self.counts=_maparray(self.buf,offset,'d',n*nlabels)
+    offset+=8*n*nlabels
+    self.cols=_maparray(self.buf,offset,'i',n)
+    self.tb=_maparray(self.buf,offset+4*n,'i',n)
+    self.fb=_maparray(self.buf,offset+8*n,'i',n)
+    self.kinds=_maparray(self.buf,offset+12*n,'b',n)
+    self.values=_lazylist(n,self._value)
+    self.numeric=_lazylist(n,lambda i:self.kinds[i] in (MODEL_FLOAT,MODEL_INT))
+    self.results=_lazylist(n,self._results)
+
+  def __len__(self):
+    return len(self.cols)
+
+  def _value(self,i):
+    kind=self.kinds[i]
+    if kind==MODEL_FLOAT: return float(self.numbers[i])
+    if kind==MODEL_INT: return int(self.numbers[i])
+    if kind==MODEL_CATEGORY: return self.categories[int(self.numbers[i])]
+    if kind==MODEL_CATEGORYSET: return self.sets[int(self.numbers[i])]
+    return None
+
+  def _results(self,i):
+    if self.kinds[i]!=MODEL_LEAF: return None
+    results={}
+    for j in range(0,len(self.labels)):
+      c=float(self.counts[i*len(self.labels)+j])
+      if c==0: continue
+      if c==int(c): c=int(c)
+      results[self.labels[j]]=c
+    return results
+
+def load_tree(filename):
+  return mappedtree(filename)
+
+# A columnset saved with save_columnset is a header, a pickle of
+# everything but the arrays (labels, categories, isint, where each
+# array (values, codes, ints and results) starts and whatever extra the caller wants kept with it),
+# then the arrays themselves, raw. load_columnset maps the file
+# and reads the arrays in place, so loading costs about as much as
+# reading the file.
+COLUMNS_MAGIC='LCCOLS\0\0'
+COLUMNS_VERSION=2
+COLUMNS_HEADER='<8sII'
+
+def save_columnset(data,filename,extra=None):
+  import cPickle
+  arrays=[]
+  def place(a):
+    if a is None: return None
+    arrays.append(numpy.ascontiguousarray(a))
+    return len(arrays)-1
+  layout=([place(v) for v in data.values],[place(c) for c in data.codes],
+          [place(m) for m in data.ints],place(data.y))
+
+  offsets,offset=[],0
+  for a in arrays:
+    offsets.append((offset,a.dtype.str,len(a)))
+    offset+=a.nbytes+(-a.nbytes)%8
+  meta=cPickle.dumps({'labels':data.labels,'categories':data.categories,'isint':data.isint,
+                      'layout':layout,'offsets':offsets,'extra':extra},2)
+  meta+=' '*(-(struct.calcsize(COLUMNS_HEADER)+len(meta))%8)
+
+  f=open(filename,'wb')
+  try:
+    f.write(struct.pack(COLUMNS_HEADER,COLUMNS_MAGIC,COLUMNS_VERSION,len(meta)))
+    f.write(meta)
+    for a in arrays:
+      f.write(a.tostring())
+      f.write('\0'*((-a.nbytes)%8))
+  finally:
+    f.close()
+
+# Returns the columnset and the extra it was saved with
+def load_columnset(filename):
+  import cPickle
+  f=open(filename,'rb')
+  try:
+    buf=mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+  finally:
+    f.close()
+  magic,version,size=struct.unpack_from(COLUMNS_HEADER,buf,0)
+  if magic!=COLUMNS_MAGIC: raise ValueError('%s is not a saved columnset' % filename)
+  if version!=COLUMNS_VERSION:
+    raise ValueError('%s is a version %d columnset, expected %d' % (filename,version,COLUMNS_VERSION))
+  start=struct.calcsize(COLUMNS_HEADER)
+  meta=cPickle.loads(buf[start:start+size])
+  start+=size
+  arrays=[numpy.frombuffer(buf,dtype=dtype,count=count,offset=start+offset)
+          for offset,dtype,count in meta['offsets']]
+  take=lambda i:None if i==None else arrays[i]
+  values,codes,ints,y=meta['layout']
+  data=columnset([take(i) for i in values],[take(i) for i in codes],meta['categories'],
+                 meta['isint'],take(y),meta['labels'],[take(i) for i in ints])
+  return data,meta['extra']
+
+# Merge pairs of leaves whose split gains less than mingain,
+# working up from the bottom so that merged pairs can merge again.
+# Everything is worked out from the leaves' result counts, in one
+# pass that visits each node after its branches.
 def prune(tree,mingain):
-  # If the branches aren't leaves, then prune them
-  if tree.tb.results==None:
-    prune(tree.tb,mingain)
-  if tree.fb.results==None:
-    prune(tree.fb,mingain)
-    
-  # If both the subbranches are now leaves, see if they
-  # should merged
-  if tree.tb.results!=None and tree.fb.results!=None:
-    # Build a combined dataset
-    tb,fb=[],[]
-    for v,c in tree.tb.results.items():
-      tb+=[[v]]*c
-    for v,c in tree.fb.results.items():
-      fb+=[[v]]*c
-    
-    # Test the reduction in entropy
-    delta=entropy(tb+fb)-(entropy(tb)+entropy(fb)/2)
-
-    if delta<mingain:
-      # Merge the branches
-      tree.tb,tree.fb=None,None
-      tree.results=uniquecounts(tb+fb)
+  stack=[(tree,False)]
+  while len(stack)>0:
+    node,ready=stack.pop()
+    if node.results!=None: continue
+    if not ready:
+      stack.append((node,True))
+      stack.append((node.fb,False))
+      stack.append((node.tb,False))
+      continue
+
+    # If both the subbranches are now leaves, see if they
+    # should merged
+    if node.tb.results!=None and node.fb.results!=None:
+      tb,fb=node.tb.results,node.fb.results
+      merged=dict(tb)
+      for v,c in fb.items(): merged[v]=merged.get(v,0)+c
 
+      # Test the reduction in entropy
+      delta=entropyofcounts(merged.values())-(entropyofcounts(tb.values())+
+                                              entropyofcounts(fb.values())/2)
+
+      if delta<mingain:
+        # Merge the branches
+        node.tb,node.fb=None,None
+        node.results=merged
+        node.counts=merged
+        node.total=sum(merged.values())
+
+# Classify an observation that may have missing (None) values. A
+# missing value sends the observation down both branches, weighted
+# by how many training rows went each way (the cached totals, see
+# cachecounts), and the results of all the leaves it reaches are
+# added up.
 def mdclassify(observation,tree):
-  if tree.results!=None:
-    return tree.results
-  else:
-    v=observation[tree.col]
+  if getattr(tree,'total',None)==None: cachecounts(tree)
+  # Follow the observation until it reaches a leaf or a missing value
+  node=tree
+  while node.results==None:
+    v=observation[node.col]
+    if v==None: break
+    node=_branch(node,v)
+  if node.results!=None:
+    return node.results
+
+  result={}
+  stack=[(node,1.0)]
+  while len(stack)>0:
+    node,weight=stack.pop()
+    if node.results!=None:
+      for k,c in node.results.items():
+        result[k]=result.get(k,0)+c*weight
+      continue
+    v=observation[node.col]
     if v==None:
-      tr,fr=mdclassify(observation,tree.tb),mdclassify(observation,tree.fb)
-      tcount=sum(tr.values())
-      fcount=sum(fr.values())
-      tw=float(tcount)/(tcount+fcount)
-      fw=float(fcount)/(tcount+fcount)
-      result={}
-      for k,v in tr.items(): result[k]=v*tw
-      for k,v in fr.items(): result[k]=v*fw      
-      return result
+      total=node.tb.total+node.fb.total
+      tw=float(node.tb.total)/total if total else 0.5
+      stack.append((node.tb,weight*tw))
+      stack.append((node.fb,weight*(1-tw)))
     else:
-      if isinstance(v,int) or isinstance(v,float):
-        if v>=tree.value: branch=tree.tb
-        else: branch=tree.fb
-      else:
-        if v==tree.value: branch=tree.tb
-        else: branch=tree.fb
-      return mdclassify(observation,branch)
+      stack.append((_branch(node,v),weight))
+  return result
+
+def _branch(tree,v):
+  if isinstance(tree.value,frozenset):
+    if v in tree.value: return tree.tb
+    else: return tree.fb
+  if isinstance(v,int) or isinstance(v,float):
+    if v>=tree.value: return tree.tb
+    else: return tree.fb
+  else:
+    if v==tree.value: return tree.tb
+    else: return tree.fb
+
+# Give every node of a tree the counts of the results of all the
+# training rows under it, and their total. Leaves just total up
+# their results; every other node adds up its two branches.
+def cachecounts(tree):
+  stack=[(tree,False)]
+  while len(stack)>0:
+    node,ready=stack.pop()
+    if node.tb==None or node.fb==None:
+      node.counts=node.results or {}
+      node.total=sum(node.counts.values())
+    elif ready:
+      counts=dict(node.tb.counts)
+      for k,c in node.fb.counts.items(): counts[k]=counts.get(k,0)+c
+      node.counts=counts
+      node.total=node.tb.total+node.fb.total
+    else:
+      stack.append((node,True))
+      stack.append((node.fb,False))
+      stack.append((node.tb,False))
+  return tree
 
 def variance(rows):
   if len(rows)==0: return 0
@@ -212,39 +889,884 @@ def variance(rows):
   variance=sum([(d-mean)**2 for d in data])/len(data)
   return variance
 
-def buildtree(rows,scoref=entropy):
-  if len(rows)==0: return decisionnode()
-  current_score=scoref(rows)
+# Find the best split on one column. Numeric values are sorted
+# once and swept from the top down with running counts of the
+# results, so each threshold is scored from counts alone and the
+# whole column costs O(n log n). Only the rows listed in index
+# are looked at, if it's given, and splits leaving fewer than
+# minleaf rows on either side are skipped. Returns (gain,value)
+def bestsplit(rows,column,scoref=entropy,current_score=None,index=None,minleaf=1,
+              categorysets=False):
+   if index!=None: rows=_IndexedRows(rows,index)
+   countscore=_countscores.get(scoref)
+   if countscore==None:
+      return _bestsplitbydividing(list(rows),column,scoref,current_score,minleaf)
+   total=len(rows)
+   totals=uniquecounts(rows)
+   if current_score==None: current_score=countscore(totals.values(),total)
+
+   best_gain=0.0
+   best_value=None
+
+   def score(set1,len1):
+      len2=total-len1
+      if len1<max(minleaf,1) or len2<max(minleaf,1): return 0.0
+      set2=[totals[r]-set1.get(r,0) for r in totals]
+      p=float(len1)/total
+      return current_score-p*countscore(set1.values(),len1)-(1-p)*countscore(set2,len2)
+
+   # Split the column into numeric values and nominal ones. A
+   # nominal value always compares greater than a number (and None
+   # always less), so those rows land on a fixed side of every
+   # numeric threshold.
+   numeric=[]
+   nominal={}
+   above={}
+   above_count=0
+   for row in rows:
+      v=row[column]
+      r=row[len(row)-1]
+      if isinstance(v,int) or isinstance(v,float):
+         numeric.append((v,r))
+         continue
+      counts=nominal.setdefault(v,{})
+      counts[r]=counts.get(r,0)+1
+      if v!=None:
+         above[r]=above.get(r,0)+1
+         above_count+=1
+
+   # Nominal values split on equality
+   for value,counts in nominal.items():
+      gain=score(counts,sum(counts.values()))
+      if gain>best_gain:
+         best_gain,best_value=gain,value
 
-  # Set up some variables to track the best criteria
-  best_gain=0.0
-  best_criteria=None
-  best_sets=None
-  
+   # Or on being in a set of them (see categoryorder)
+   if categorysets and len(nominal)>1:
+      order=categoryorder(nominal,min(totals))
+      set1={}
+      len1=0
+      best_size=0
+      for i in range(0,len(order)):
+         for r,c in nominal[order[i]].items(): set1[r]=set1.get(r,0)+c
+         len1+=sum(nominal[order[i]].values())
+         if i==0: continue
+         gain=score(set1,len1)
+         if gain>best_gain:
+            best_gain,best_size=gain,i+1
+      if best_size>0: best_value=frozenset(order[:best_size])
+
+   # Numeric values split on >=, so sweep them from largest to
+   # smallest and score each distinct value once all of its rows
+   # have moved into the true set
+   numeric.sort(reverse=True)
+   set1=dict(above)
+   len1=above_count
+   for i in range(len(numeric)):
+      v,r=numeric[i]
+      set1[r]=set1.get(r,0)+1
+      len1+=1
+      if i+1<len(numeric) and numeric[i+1][0]==v: continue
+      gain=score(set1,len1)
+      if gain>best_gain:
+         best_gain,best_value=gain,v
+   return (best_gain,best_value)
+
+# Order the categories of a column by the share of their rows
+# that have the first result (for Lending Club rows, BAD comes
+# before GOOD), given the result counts for each category. For two
+# results the best set of categories to split off is always a run
+# from the start of this order (Breiman et al.), so a single sweep
+# along it finds the best set split instead of trying every subset.
+def categoryorder(counts,first):
+   def share(v):
+      c=counts[v]
+      return float(c.get(first,0))/sum(c.values())
+   # Ties go by value, with unicode compared as utf-8 as a str and
+   # a unicode that isn't ASCII can't be compared
+   def tiebreak(v):
+      if isinstance(v,unicode): return v.encode('utf-8')
+      return v
+   return sorted(counts.keys(),key=lambda v:(share(v),tiebreak(v)))
+
+# Scores that can't be worked out from counts (like variance)
+# still need every candidate set built and scored
+def _bestsplitbydividing(rows,column,scoref,current_score=None,minleaf=1):
+   if current_score==None: current_score=scoref(rows)
+   best_gain=0.0
+   best_value=None
+   column_values={}
+   for row in rows:
+      column_values[row[column]]=1
+   for value in column_values.keys():
+      (set1,set2)=divideset(rows,column,value)
+      if len(set1)<max(minleaf,1) or len(set2)<max(minleaf,1): continue
+      p=float(len(set1))/len(rows)
+      gain=current_score-p*scoref(set1)-(1-p)*scoref(set2)
+      if gain>best_gain:
+         best_gain,best_value=gain,value
+   return (best_gain,best_value)
+
+# The bins one column has been bucketed into. Numeric values
+# fall into bins 0..len(edges)-1, where bin b holds the values
+# from edges[b] up to the next edge, and each nominal value after
+# that gets a bin of its own. Rare nominal values beyond maxbins
+# share a final bin that is never split on.
+class columnbins:
+  def __init__(self,edges=None,nominal=None,nonebin=-1):
+    self.edges=edges or []
+    self.nominal=nominal or []
+    self.nonebin=nonebin
+    self.nominalcodes=dict([(v,len(self.edges)+i) for i,v in enumerate(self.nominal)])
+
+  def code(self,v):
+    if isinstance(v,int) or isinstance(v,float):
+      return max(bisect_right(self.edges,v)-1,0)
+    return self.nominalcodes.get(v,len(self.edges)+len(self.nominal))
+
+# A set of rows with every column swapped for its bin number and
+# the result swapped for an index into labels
+class binnedset:
+  def __init__(self,rows,columns,labels):
+    self.rows=rows
+    self.columns=columns
+    self.labels=labels
+
+  def __len__(self):
+    return len(self.rows)
+
+# Pre-bucket every column into at most maxbins numeric bins (cut
+# at quantiles when there are more distinct values than that)
+# plus at most maxbins nominal bins. This is done once up front so
+# the tree can be grown from per-bin histograms.
+def binrows(rows,maxbins=255):
+  labels=sorted(uniquecounts(rows).keys())
+  labelindex=dict([(l,i) for i,l in enumerate(labels)])
   column_count=len(rows[0])-1
+
+  columns=[]
   for col in range(0,column_count):
-    # Generate the list of different values in
-    # this column
-    column_values={}
+    numeric=[]
+    nominal={}
     for row in rows:
-       column_values[row[col]]=1
-    # Now try dividing the rows up for each value
-    # in this column
-    for value in column_values.keys():
-      (set1,set2)=divideset(rows,col,value)
-      
-      # Information gain
-      p=float(len(set1))/len(rows)
-      gain=current_score-p*scoref(set1)-(1-p)*scoref(set2)
-      if gain>best_gain and len(set1)>0 and len(set2)>0:
+      v=row[col]
+      if isinstance(v,int) or isinstance(v,float): numeric.append(v)
+      else: nominal[v]=nominal.get(v,0)+1
+
+    numeric.sort()
+    edges=[]
+    for i in range(0,maxbins):
+      if i*len(numeric)/maxbins>=len(numeric): break
+      v=numeric[i*len(numeric)/maxbins]
+      if len(edges)==0 or v>edges[-1]: edges.append(v)
+
+    # Keep the most common nominal values, and always keep None
+    # since it sits below every numeric threshold
+    values=sorted(nominal.keys(),key=lambda v:(v!=None,-nominal[v]))[:maxbins]
+    nonebin=-1
+    if None in nominal: nonebin=len(edges)
+    columns.append(columnbins(edges,values,nonebin))
+
+  coded=[[columns[col].code(row[col]) for col in range(0,column_count)]+
+         [labelindex[row[len(row)-1]]] for row in rows]
+  return binnedset(coded,columns,labels)
+
+# Count the results falling in every bin of every column
+def _histograms(binned,rows):
+  hists=[]
+  for bins in binned.columns:
+    size=len(bins.edges)+len(bins.nominal)+1
+    hists.append([[0]*len(binned.labels) for i in range(size)])
+  for row in rows:
+    r=row[-1]
+    for col in range(0,len(hists)):
+      hists[col][row[col]][r]+=1
+  return hists
+
+def _subtracthistograms(parent,child):
+  return [[[p-c for p,c in zip(pb,cb)] for pb,cb in zip(pcol,ccol)]
+          for pcol,ccol in zip(parent,child)]
+
+# Find the best split on one column from its histogram alone.
+# Returns (gain,bin,isnumeric)
+def _bestbinsplit(hist,bins,totals,total,countscore,current_score,minleaf=1,
+                  categorysets=False):
+  best=(0.0,None,False)
+  def score(set1):
+    len1=sum(set1)
+    len2=total-len1
+    if len1<max(minleaf,1) or len2<max(minleaf,1): return 0.0
+    set2=[t-c for t,c in zip(totals,set1)]
+    p=float(len1)/total
+    return current_score-p*countscore(set1,len1)-(1-p)*countscore(set2,len2)
+
+  # Equality splits on the nominal bins, except the shared one
+  numeric_bins=len(bins.edges)
+  for b in range(numeric_bins,numeric_bins+len(bins.nominal)):
+    if sum(hist[b])==0: continue
+    gain=score(hist[b])
+    if gain>best[0]: best=(gain,b,False)
+
+  # Set splits sweep the nominal bins in categoryorder; the bin
+  # comes back as a frozenset of bins
+  if categorysets:
+    found=dict([(b,dict(enumerate(hist[b])))
+                for b in range(numeric_bins,numeric_bins+len(bins.nominal)) if sum(hist[b])>0])
+    order=categoryorder(found,0)
+    set1=[0]*len(totals)
+    for i in range(0,len(order)):
+      set1=[s+c for s,c in zip(set1,hist[order[i]])]
+      if i==0: continue
+      gain=score(set1)
+      if gain>best[0]: best=(gain,frozenset(order[:i+1]),False)
+
+  # Threshold splits sweep the numeric bins from the top down.
+  # Nominal rows other than None are always in the true set.
+  set1=[0]*len(totals)
+  for b in range(numeric_bins,len(hist)):
+    if b==bins.nonebin: continue
+    set1=[s+c for s,c in zip(set1,hist[b])]
+  for b in range(numeric_bins-1,-1,-1):
+    if sum(hist[b])==0: continue
+    set1=[s+c for s,c in zip(set1,hist[b])]
+    gain=score(set1)
+    if gain>best[0]: best=(gain,b,True)
+  return best
+
+# What every splitter shares: which columns a node searches. That
+# is all of them, unless maxfeatures is set (for a random forest),
+# in which case each node searches maxfeatures columns picked at
+# random by rng.
+class _splitter:
+  maxfeatures=None
+  rng=None
+  categorysets=False
+
+  def columns(self,count):
+    if self.maxfeatures==None or self.maxfeatures>=count: return range(0,count)
+    return sorted(self.rng.sample(xrange(0,count),self.maxfeatures))
+
+# Splits the nodes of a binnedset. A node is a slice of the shared
+# index along with the histograms of the rows in it.
+class _binnedsplitter(_splitter):
+  def __init__(self,binned,index,countscore,minleaf=1):
+    self.binned=binned
+    self.index=index
+    self.countscore=countscore
+    self.minleaf=minleaf
+
+  def root(self):
+    rows=_IndexedRows(self.binned.rows,self.index)
+    return (0,len(self.index),_histograms(self.binned,rows))
+
+  def size(self,node):
+    return node[1]-node[0]
+
+  def bestsplit(self,node,depth):
+    lo,hi,hists=node
+    total=hi-lo
+    totals=[sum(c) for c in zip(*hists[0])]
+    current_score=self.countscore(totals,total)
+
+    best_gain=0.0
+    best_criteria=None
+    for col in self.columns(len(self.binned.columns)):
+      gain,b,isnumeric=_bestbinsplit(hists[col],self.binned.columns[col],totals,total,
+                                     self.countscore,current_score,self.minleaf,
+                                     self.categorysets)
+      if gain>best_gain:
         best_gain=gain
-        best_criteria=(col,value)
-        best_sets=(set1,set2)
-  # Create the sub branches   
-  if best_gain>0:
-    trueBranch=buildtree(best_sets[0])
-    falseBranch=buildtree(best_sets[1])
-    return decisionnode(col=best_criteria[0],value=best_criteria[1],
-                        tb=trueBranch,fb=falseBranch)
-  else:
-    return decisionnode(results=uniquecounts(rows))
+        best_criteria=(col,b,isnumeric)
+    return (best_gain,best_criteria)
+
+  def divide(self,node,criteria):
+    lo,hi,hists=node
+    col,b,isnumeric=criteria
+    rows=self.binned.rows
+    bins=self.binned.columns[col]
+    if isnumeric:
+      value=bins.edges[b]
+      test=lambda i:rows[i][col]>=b and rows[i][col]!=bins.nonebin
+    elif isinstance(b,frozenset):
+      value=frozenset([bins.nominal[x-len(bins.edges)] for x in b])
+      test=lambda i:rows[i][col] in b
+    else:
+      value=bins.nominal[b-len(bins.edges)]
+      test=lambda i:rows[i][col]==b
+    mid=partition(self.index,lo,hi,test)
+
+    # Only scan the smaller child; the other one's histograms are
+    # whatever is left over from the parent
+    if mid-lo<=hi-mid:
+      h1=_histograms(self.binned,_IndexedRows(rows,self.index[lo:mid]))
+      h2=_subtracthistograms(hists,h1)
+    else:
+      h2=_histograms(self.binned,_IndexedRows(rows,self.index[mid:hi]))
+      h1=_subtracthistograms(hists,h2)
+    return (col,value,(lo,mid,h1),(mid,hi,h2))
+
+  def leaf(self,node):
+    totals=[sum(c) for c in zip(*node[2][0])]
+    results={}
+    for i in range(0,len(totals)):
+      if totals[i]>0: results[self.binned.labels[i]]=totals[i]
+    return results
+
+# A dataset stored by column rather than by row. Numeric columns
+# are float arrays and nominal columns are integer codes into a
+# list of categories. A column holding both keeps both: its
+# nominal rows read as +inf in the float array (-inf for None) so
+# they fall on the same side of a threshold that they would in a
+# row, and its numeric rows have the code -1. The results are
+# codes into labels. isint says a column's numbers are all whole;
+# a column with both whole and fractional numbers has a mask in
+# ints of the rows that were whole (the other columns have None),
+# so that rows gives back ints and floats just as they went in.
+class columnset:
+  def __init__(self,values,codes,categories,isint,y,labels,ints=None):
+    self.values=values
+    self.codes=codes
+    self.categories=categories
+    self.isint=isint
+    self.y=y
+    self.labels=labels
+    if ints==None: ints=[None]*len(values)
+    self.ints=ints
+
+  def __len__(self):
+    return len(self.y)
+
+  # Build a columnset from an iterable of rows (the last column of
+  # each row is the result), one row at a time
+  @classmethod
+  def fromrows(cls,rows):
+    if numpy==None: raise ImportError('columnset needs numpy')
+    buffers=None
+    results=[]
+    for row in rows:
+      if buffers==None: buffers=[columnbuffer() for col in range(0,len(row)-1)]
+      for col in range(0,len(buffers)):
+        buffers[col].add(row[col])
+      results.append(row[len(row)-1])
+    if buffers==None: return cls([],[],[],[],numpy.zeros(0,int),[])
+    return cls.frombuffers(buffers,results)
+
+  # Build a columnset from a filled columnbuffer for each column
+  # and the list of results
+  @classmethod
+  def frombuffers(cls,buffers,results):
+    if numpy==None: raise ImportError('columnset needs numpy')
+    labels=sorted(set(results))
+    labelindex=dict([(l,i) for i,l in enumerate(labels)])
+    y=numpy.array([labelindex[r] for r in results],dtype=numpy.intp)
+    values,codes,names,isint,ints=[],[],[],[],[]
+    for buf in buffers:
+      v,c,n,i,m=buf.finish()
+      values.append(v)
+      codes.append(c)
+      names.append(n)
+      isint.append(i)
+      ints.append(m)
+    return cls(values,codes,names,isint,y,labels,ints)
+
+  # The rows back out again, as lists with the result last like
+  # the ones fromrows takes, converting chunk rows at a time
+  def rows(self,chunk=10000):
+    for lo in xrange(0,len(self),chunk):
+      hi=min(lo+chunk,len(self))
+      columns=[]
+      for col in range(0,len(self.values)):
+        values,codes,cats=self.values[col],self.codes[col],self.categories[col]
+        if values is not None:
+          values=values[lo:hi].tolist()
+          if self.isint[col]: whole=[True]*(hi-lo)
+          elif self.ints[col] is None: whole=[False]*(hi-lo)
+          else: whole=self.ints[col][lo:hi].tolist()
+        if codes is None:
+          columns.append([int(v) if w else v for v,w in zip(values,whole)])
+        elif values is None:
+          columns.append([cats[c] for c in codes[lo:hi].tolist()])
+        else:
+          columns.append([cats[c] if c>=0 else int(v) if w else v
+                          for c,v,w in zip(codes[lo:hi].tolist(),values,whole)])
+      columns.append([self.labels[r] for r in self.y[lo:hi].tolist()])
+      for row in zip(*columns):
+        yield list(row)
+
+  # The rows picked out by a mask or an array of indices
+  def subset(self,which):
+    take=lambda a:a if a is None else a[which]
+    return columnset([take(v) for v in self.values],[take(c) for c in self.codes],
+                     self.categories,self.isint,self.y[which],self.labels,
+                     [take(m) for m in self.ints])
+
+  # A columnset of just the columns listed in cols, in that order
+  def select(self,cols):
+    pick=lambda a:[a[col] for col in cols]
+    return columnset(pick(self.values),pick(self.codes),pick(self.categories),
+                     pick(self.isint),self.y,self.labels,pick(self.ints))
+
+  # The column value a split will compare rows against
+  def splitvalue(self,col,value,isnumeric):
+    if isinstance(value,frozenset):
+      return frozenset([self.categories[col][c] for c in value])
+    if not isnumeric: return self.categories[col][value]
+    if self.isint[col]: return int(value)
+    return float(value)
+
+  # A mask of the rows (out of those picked by which, if given)
+  # that go down the true branch of a split
+  def splitmask(self,col,value,isnumeric,which=None):
+    if isnumeric: column=self.values[col]
+    else: column=self.codes[col]
+    if which is not None: column=column[which]
+    if isnumeric: return column>=value
+    if isinstance(value,frozenset): return numpy.in1d(column,list(value))
+    return column==value
+
+# One column of a columnset, filled a value at a time. Values go
+# straight into typed arrays (from the array module) rather than
+# lists of Python objects: numbers into a float array, and
+# everything else gets a code into the column's categories.
+class columnbuffer:
+  def __init__(self):
+    self.numbers=array('d')
+    self.codes=array('i')
+    self.categories={}
+    self.ints=array('b')
+    self.hasnumeric=False
+    self.hasint=False
+    self.isint=True
+
+  def __len__(self):
+    return len(self.codes)
+
+  def add(self,v):
+    if isinstance(v,int) or isinstance(v,float):
+      self.numbers.append(v)
+      self.codes.append(-1)
+      self.hasnumeric=True
+      if isinstance(v,int):
+        self.ints.append(1)
+        self.hasint=True
+      else:
+        self.ints.append(0)
+        self.isint=False
+    else:
+      self.ints.append(0)
+      if v==None: self.numbers.append(float('-inf'))
+      else: self.numbers.append(float('inf'))
+      self.codes.append(self.categories.setdefault(v,len(self.categories)))
+
+  # The column as columnset keeps it: (values,codes,categories,
+  # isint,ints)
+  def finish(self):
+    cats=self.categories
+    names=sorted(cats.keys(),key=cats.get)
+    hasnumeric=len(cats)==0 or self.hasnumeric
+    values=codes=None
+    if hasnumeric: values=numpy.frombuffer(self.numbers,dtype=float).copy()
+    if len(cats)>0: codes=numpy.frombuffer(self.codes,dtype=numpy.int32).copy()
+    ints=None
+    if self.hasint and not self.isint: ints=numpy.frombuffer(self.ints,dtype=numpy.int8)!=0
+    return (values,codes,names,hasnumeric and self.isint,ints)
+
+# Find the best split on one column of a columnset, over the rows
+# listed in index, in a few vectorized passes. Returns
+# (gain,value,isnumeric) where value is a threshold or a category
+# code.
+def _bestcolumnsplit(data,col,index,y,totals,arrayscore,current_score,minleaf=1,
+                     categorysets=False):
+  n=len(y)
+  labels=len(totals)
+  best=(0.0,None,False)
+
+  def gains(set1):
+    len1=set1.sum(axis=1)
+    len2=n-len1
+    p=len1/float(n)
+    g=current_score-p*arrayscore(set1,len1)-(1-p)*arrayscore(totals-set1,len2)
+    return numpy.where((len1>=max(minleaf,1))&(len2>=max(minleaf,1)),g,0.0)
+
+  # Equality splits, one per category
+  codes=data.codes[col]
+  if codes is not None:
+    codes=codes[index]
+    nominal=codes>=0
+    size=len(data.categories[col])
+    counts=numpy.bincount(codes[nominal]*labels+y[nominal],
+                          minlength=size*labels).reshape(size,labels)
+    g=gains(counts)
+    i=g.argmax()
+    if g[i]>best[0]: best=(g[i],i,False)
+
+    # Set splits: running counts down the categories in
+    # categoryorder, coming back as a frozenset of codes
+    present=numpy.nonzero(counts.sum(axis=1))[0]
+    if categorysets and len(present)>1:
+      sizes=counts[present].sum(axis=1)
+      order=present[numpy.lexsort((present,counts[present,0]/sizes.astype(float)))]
+      g=gains(counts[order].cumsum(axis=0))
+      g[0]=0.0
+      i=g.argmax()
+      if g[i]>best[0]: best=(g[i],frozenset(order[:i+1].tolist()),False)
+
+  # Threshold splits: sort once and take running counts of the
+  # results, so the false set of each distinct value is just the
+  # counts of everything before it
+  values=data.values[col]
+  if values is not None:
+    values=values[index]
+    order=values.argsort(kind='mergesort')
+    sv=values[order]
+    onehot=numpy.zeros((n,labels),dtype=numpy.intp)
+    onehot[numpy.arange(n),y[order]]=1
+    before=onehot.cumsum(axis=0)-onehot
+    first=numpy.ones(n,dtype=bool)
+    first[1:]=sv[1:]!=sv[:-1]
+    candidates=numpy.nonzero(first&numpy.isfinite(sv))[0]
+    if len(candidates)>0:
+      g=gains(totals-before[candidates])
+      i=g.argmax()
+      if g[i]>best[0]: best=(g[i],sv[candidates[i]],True)
+  return best
+
+# Splits the nodes of a columnset. A node is a slice of the shared
+# index array, partitioned in place when it is split. Columns are
+# searched on a thread pool, if there is one.
+class _columnsplitter(_splitter):
+  def __init__(self,data,index,arrayscore,minleaf=1,pool=None):
+    self.data=data
+    self.index=index
+    self.arrayscore=arrayscore
+    self.minleaf=minleaf
+    self.pool=pool
+
+  def root(self):
+    return (0,len(self.index))
+
+  def size(self,node):
+    return node[1]-node[0]
+
+  def bestsplit(self,node,depth):
+    lo,hi=node
+    data=self.data
+    rows=self.index[lo:hi]
+    y=data.y[rows]
+    totals=numpy.bincount(y,minlength=len(data.labels))
+    current_score=self.arrayscore(totals[None,:],numpy.array([hi-lo]))[0]
+
+    search=lambda col:_bestcolumnsplit(data,col,rows,y,totals,self.arrayscore,
+                                       current_score,self.minleaf,self.categorysets)
+    columns=self.columns(len(data.values))
+    if self.pool!=None and hi-lo>=PARALLEL_MIN_ROWS:
+      splits=self.pool.map(search,columns)
+    else:
+      splits=[search(col) for col in columns]
+
+    best_gain=0.0
+    best_criteria=None
+    for col,split in zip(columns,splits):
+      gain,value,isnumeric=split
+      if gain>best_gain:
+        best_gain=gain
+        best_criteria=(col,value,isnumeric)
+    return (best_gain,best_criteria)
+
+  def divide(self,node,criteria):
+    lo,hi=node
+    col,value,isnumeric=criteria
+    rows=self.index[lo:hi]
+    mask=self.data.splitmask(col,value,isnumeric,rows)
+    mid=lo+mask.sum()
+    self.index[lo:hi]=numpy.concatenate((rows[mask],rows[~mask]))
+    return (col,self.data.splitvalue(col,value,isnumeric),(lo,mid),(mid,hi))
+
+  def leaf(self,node):
+    y=self.data.y[self.index[node[0]:node[1]]]
+    totals=numpy.bincount(y,minlength=len(self.data.labels))
+    results={}
+    for i in numpy.nonzero(totals)[0]:
+      results[self.data.labels[i]]=int(totals[i])
+    return results
+
+# Nodes with fewer rows than this search their columns in the
+# calling process even when there's a pool, since handing them
+# out costs more than it saves
+PARALLEL_MIN_ROWS=2000
+
+# Split a list of columns into at most n runs of neighbours
+def _columnchunks(columns,n):
+  size=(len(columns)+n-1)/n
+  return [columns[i:i+size] for i in range(0,len(columns),size)]
+
+# Splits the nodes of a list of rows. A node is a slice of the
+# shared index, partitioned in place when it is split, so rows are
+# never copied. Columns are searched on a process pool of workers
+# processes, if there is one.
+class _rowsplitter(_splitter):
+  def __init__(self,rows,index,scoref,minleaf=1,pool=None,workers=None):
+    self.rows=rows
+    self.index=index
+    self.scoref=scoref
+    self.minleaf=minleaf
+    self.pool=pool
+    self.workers=workers
+
+  def root(self):
+    return (0,len(self.index))
+
+  def size(self,node):
+    return node[1]-node[0]
+
+  def bestsplit(self,node,depth):
+    lo,hi=node
+    rows=self.rows
+    scoref=self.scoref
+    node=_IndexedRows(rows,self.index[lo:hi])
+    countscore=_countscores.get(scoref)
+    if countscore!=None:
+      current_score=countscore(uniquecounts(node).values(),hi-lo)
+    else:
+      current_score=scoref(list(node))
+
+    # Set up some variables to track the best criteria
+    best_gain=0.0
+    best_criteria=None
+
+    columns=self.columns(len(rows[0])-1)
+    if self.pool!=None and hi-lo>=PARALLEL_MIN_ROWS:
+      # Hand each worker a run of columns; taking the first best of
+      # the runs in order matches what the loop below would pick
+      tasks=[(chunk,node.index,scoref,current_score,self.minleaf,self.categorysets)
+             for chunk in _columnchunks(columns,self.workers)]
+      for gain,criteria in self.pool.map(_bestsplitofcolumns,tasks):
+        if gain>best_gain:
+          best_gain=gain
+          best_criteria=criteria
+    else:
+      for col in columns:
+        # Find the best value to divide this column on
+        gain,value=bestsplit(rows,col,scoref,current_score,node.index,self.minleaf,
+                             self.categorysets)
+        if gain>best_gain:
+          best_gain=gain
+          best_criteria=(col,value)
+    return (best_gain,best_criteria)
+
+  def divide(self,node,criteria):
+    lo,hi=node
+    col,value=criteria
+    rows=self.rows
+    split_function=splitfunction(col,value)
+    mid=partition(self.index,lo,hi,lambda i:split_function(rows[i]))
+    return (col,value,(lo,mid),(mid,hi))
+
+  def leaf(self,node):
+    return uniquecounts(_IndexedRows(self.rows,self.index[node[0]:node[1]]))
+
+# Grow a tree down from the root node of a splitter, without
+# recursing. Nodes that are worth splitting wait on a stack, or,
+# when maxleaves is given, in a heap so that the biggest gains are
+# split first until the tree has maxleaves leaves. Nodes at depth
+# frontier with enough rows are handed to dispatch instead, which
+# returns the AsyncResult of building them elsewhere.
+def _growtree(splitter,root,depth=0,maxdepth=None,minsplit=2,mingain=0.0,
+              maxleaves=None,frontier=None,dispatch=None):
+  top=decisionnode()
+  waiting=[]
+  made=[(root,depth,top,'tb')]
+  order=0
+  leaves=1
+  while len(made)>0 or len(waiting)>0:
+    # Decide what to do with each newly made node
+    while len(made)>0:
+      node,d,parent,branch=made.pop()
+      size=splitter.size(node)
+      if dispatch!=None and d==frontier and size>=PARALLEL_MIN_ROWS:
+        setattr(parent,branch,_pendingnode(dispatch(node)))
+        continue
+      gain=0.0
+      if size>=max(minsplit,2) and (maxdepth==None or d<maxdepth):
+        gain,criteria=splitter.bestsplit(node,d)
+      if gain>mingain and gain>0:
+        order+=1
+        if maxleaves==None: key=-order
+        else: key=-gain
+        heappush(waiting,(key,order,node,d,criteria,parent,branch))
+      else:
+        setattr(parent,branch,decisionnode(results=splitter.leaf(node)))
+    if len(waiting)==0: break
+
+    key,o,node,d,criteria,parent,branch=heappop(waiting)
+    if maxleaves!=None and leaves>=maxleaves:
+      setattr(parent,branch,decisionnode(results=splitter.leaf(node)))
+      continue
+    col,value,truenode,falsenode=splitter.divide(node,criteria)
+    tree=decisionnode(col=col,value=value)
+    setattr(parent,branch,tree)
+    leaves+=1
+    made.append((falsenode,d+1,tree,'fb'))
+    made.append((truenode,d+1,tree,'tb'))
+  return top.tb
+
+# The rows a process pool was started with. Workers get them once
+# when they start (by fork, where there is one), so tasks only
+# carry the index of the node they're working on.
+_poolrows=None
+
+def _initpool(rows):
+  global _poolrows
+  _poolrows=rows
+
+def _bestsplitofcolumns(task):
+  columns,index,scoref,current_score,minleaf,categorysets=task
+  best=(0.0,None)
+  for col in columns:
+    gain,value=bestsplit(_poolrows,col,scoref,current_score,index,minleaf,categorysets)
+    if gain>best[0]: best=(gain,(col,value))
+  return best
+
+def _buildsubtree(task):
+  index,scoref,minleaf,limits,features=task
+  splitter=_rowsplitter(_poolrows,index,scoref,minleaf)
+  _pickfeatures(splitter,*features)
+  return compile_tree(_growtree(splitter,splitter.root(),**limits))
+
+def _buildcolumnsubtree(task):
+  index,arrayscore,minleaf,limits,features=task
+  splitter=_columnsplitter(_poolrows,index,arrayscore,minleaf)
+  _pickfeatures(splitter,*features)
+  return compile_tree(_growtree(splitter,splitter.root(),**limits))
+
+def _pickfeatures(splitter,maxfeatures,seed,categorysets=False):
+  splitter.categorysets=categorysets
+  if maxfeatures!=None:
+    splitter.maxfeatures=maxfeatures
+    splitter.rng=random.Random(seed)
+
+# Stands in for a subtree a worker is still building
+class _pendingnode:
+  def __init__(self,result):
+    self.result=result
+
+# Swap the finished subtrees into the top levels of a tree. They
+# come back compiled, as nested nodes are too deep to pickle.
+def _stitch(tree,depth):
+  if isinstance(tree,_pendingnode): return _decisionnodes(tree.result.get())
+  if depth>0 and tree.tb!=None:
+    tree.tb=_stitch(tree.tb,depth-1)
+    tree.fb=_stitch(tree.fb,depth-1)
+  return tree
+
+# Build a tree from rows. With maxbins the rows are bucketed into
+# histograms first (see binrows), and a binnedset can be passed
+# in directly to reuse the same bins for several trees. A
+# columnset is split with vectorized numpy passes instead.
+#
+# Growth can be limited: no node deeper than maxdepth or with
+# fewer than minsplit rows is split, no split may leave fewer than
+# minleaf rows on a side or gain no more than mingain, and with
+# maxleaves the best splits are made first until there are that
+# many leaves.
+#
+# With workers, each node's columns are searched in parallel: by
+# a process pool for rows, or a thread pool for a columnset (numpy
+# does the work there). Binned trees don't use workers. Adding
+# paralleldepth builds that many levels here and then hands each
+# subtree below them (with at least PARALLEL_MIN_ROWS rows) to a
+# worker process to build on its own. That can't be combined with
+# maxleaves, which needs the whole tree in one place.
+#
+# For random forests, sample gives the row numbers to build from
+# (repeats allowed, so a bootstrap sample needs no copying) and
+# maxfeatures limits each node to that many columns picked at
+# random by rng.
+#
+# With categorysets, nominal columns can also split on a set of
+# their categories (see categoryorder), with the node's value a
+# frozenset; rows whose value is in the set go down the true
+# branch. That makes for shallower trees than splitting off one
+# category at a time.
+#
+# Every node of the tree comes back with the counts of the training
+# results under it (see cachecounts).
+def buildtree(rows,scoref=entropy,maxbins=None,workers=None,paralleldepth=None,
+              maxdepth=None,minsplit=2,minleaf=1,mingain=0.0,maxleaves=None,
+              sample=None,maxfeatures=None,rng=None,categorysets=False):
+  limits={'maxdepth':maxdepth,'minsplit':minsplit,'mingain':mingain}
+  if maxleaves!=None: paralleldepth=None
+  if paralleldepth!=None: limits['depth']=paralleldepth
+  if maxfeatures!=None and rng==None: rng=random.Random()
+  # Each subtree built elsewhere picks its columns with its own rng
+  features=lambda:(maxfeatures,rng and rng.random(),categorysets)
+
+  if isinstance(rows,columnset):
+    arrayscore=_arrayscores.get(scoref)
+    if arrayscore==None:
+      raise ValueError('columnset trees need a count based score')
+    if sample!=None: index=numpy.array(sample,dtype=numpy.intp)
+    else: index=numpy.arange(len(rows))
+    pool=subtrees=dispatch=None
+    if workers:
+      from multiprocessing.pool import ThreadPool
+      pool=ThreadPool(workers)
+      if paralleldepth!=None:
+        from multiprocessing import Pool
+        subtrees=Pool(workers,_initpool,(rows,))
+        dispatch=lambda node:subtrees.apply_async(_buildcolumnsubtree,
+          ((index[node[0]:node[1]].copy(),arrayscore,minleaf,limits,features()),))
+    try:
+      splitter=_columnsplitter(rows,index,arrayscore,minleaf,pool)
+      splitter.maxfeatures,splitter.rng=maxfeatures,rng
+      splitter.categorysets=categorysets
+      tree=_growtree(splitter,splitter.root(),maxdepth=maxdepth,minsplit=minsplit,
+                     mingain=mingain,maxleaves=maxleaves,frontier=paralleldepth,
+                     dispatch=dispatch)
+      if dispatch!=None: tree=_stitch(tree,paralleldepth)
+      return cachecounts(tree)
+    finally:
+      if pool!=None: pool.terminate()
+      if subtrees!=None: subtrees.terminate()
+
+  if isinstance(rows,binnedset) or maxbins!=None:
+    countscore=_countscores.get(scoref)
+    if countscore==None:
+      raise ValueError('binned trees need a count based score')
+    binned=rows
+    if not isinstance(binned,binnedset):
+      if len(rows)==0: return decisionnode()
+      binned=binrows(rows,maxbins)
+    if sample!=None: index=list(sample)
+    else: index=range(0,len(binned.rows))
+    splitter=_binnedsplitter(binned,index,countscore,minleaf)
+    splitter.maxfeatures,splitter.rng=maxfeatures,rng
+    splitter.categorysets=categorysets
+    return cachecounts(_growtree(splitter,splitter.root(),maxdepth=maxdepth,
+                                 minsplit=minsplit,mingain=mingain,maxleaves=maxleaves))
+
+  if len(rows)==0: return decisionnode()
+  if sample!=None: index=list(sample)
+  else: index=range(0,len(rows))
+  pool=subtrees=dispatch=None
+  if workers:
+    from multiprocessing import Pool
+    pool=Pool(workers,_initpool,(rows,))
+    if paralleldepth!=None:
+      # Subtrees get a pool of their own, so the column searches of
+      # the top levels don't wait behind them
+      subtrees=Pool(workers,_initpool,(rows,))
+      dispatch=lambda node:subtrees.apply_async(_buildsubtree,
+        ((index[node[0]:node[1]],scoref,minleaf,limits,features()),))
+  try:
+    splitter=_rowsplitter(rows,index,scoref,minleaf,pool,workers)
+    splitter.maxfeatures,splitter.rng=maxfeatures,rng
+    splitter.categorysets=categorysets
+    tree=_growtree(splitter,splitter.root(),maxdepth=maxdepth,minsplit=minsplit,
+                   mingain=mingain,maxleaves=maxleaves,frontier=paralleldepth,
+                   dispatch=dispatch)
+    if dispatch!=None: tree=_stitch(tree,paralleldepth)
+    return cachecounts(tree)
+  finally:
+    if pool!=None: pool.terminate()
+    if subtrees!=None: subtrees.terminate()